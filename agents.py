@@ -1,10 +1,12 @@
+import json
 import logging
+import re
 from abc import ABC, abstractmethod
-import openai
-import anthropic
-import google.cloud.aiplatform as aiplatform
-import cohere
 from config import *
+from llm_cache import get_response_cache
+from providers import get_provider_registry, estimate_tokens
+from discussion import render_agent_results, truncate_to_tokens
+from tracing import current_span
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -14,324 +16,462 @@ class APIError(Exception):
     """Custom exception for API-related errors"""
     pass
 
+PACKED_PROMPT_TEMPLATE = """Analyze the following knowledge graph triples from a {perspective} perspective.
+They all share the same {position} entity.
+Known triples where the {position} entity is the {role}:
+{neighborhood}
+
+Triples to assess:
+{triples}
+
+For every triple, decide whether it is likely to be correct. Respond with only a JSON array
+containing one object per triple, in the same order:
+[{{"id": <number>, "verdict": "valid" or "error", "confidence": <0 to 1>, "reasoning": "<one or two sentences>"}}]"""
+
+DISCUSSION_PROMPT_TEMPLATE = """Continue your {perspective} analysis of the following knowledge graph triple:
+Triple: {triple}
+Known triples where the {position} entity is the {role}:
+{neighborhood}
+
+Discussion points raised about the agents' analyses:
+{points}
+
+Revise your analysis if necessary. Consider the points raised by other agents and provide updated reasoning."""
+
+# Appended to single-triple analysis and discussion prompts, and to the SDM's
+VERDICT_FORMAT = """
+
+End your answer with your verdict as a JSON object on its own line:
+{"verdict": "valid" or "error", "confidence": <0 to 1>, "reasoning": "<one or two sentences>"}"""
+
 class BaseAgent(ABC):
-    def __init__(self, name):
+    # Key of the agent in AGENT_PROVIDERS, which sets the provider and model
+    # name its prompts are sent to
+    role = None
+    provider = None
+    model = None
+    max_tokens = 1000  # Completion budget, also reserved against tokens/min limits
+    # (entity position, edge direction) of the neighborhood an agent reviews,
+    # e.g. ('head', 'out'); None for agents that do not analyze triples
+    perspective = None
+
+    def __init__(self, name, registry=None, use_cache=True):
         self.name = name
+        if self.role is not None:
+            self.provider = AGENT_PROVIDERS[self.role]['provider']
+            self.model = AGENT_PROVIDERS[self.role]['model']
+        # Last result, kept for inspection only. Agents are shared across
+        # concurrently analyzed triples, so methods return their own locals.
+        self.verdict = None
         self.confidence = 0.0
         self.reasoning = ""
+        # Responses are shared by all agents, keyed by provider, model and prompt
+        self.cache = get_response_cache() if use_cache else None
+        # Clients and rate limits are shared by all agents of the same provider
+        self.registry = registry or get_provider_registry()
+        
+    @property
+    def client(self):
+        """Shared provider client, created on first use; None if unavailable"""
+        if not self.provider:
+            return None
+        return self.registry.get_client(self.provider)
+    
+    @property
+    def model_handle(self):
+        """Shared handle for this agent's model, loaded once on first use"""
+        return self.registry.get_model(self.provider, self.model)
+    
+    def warmup(self):
+        """Create the client and load the model handle ahead of the first request"""
+        if not self.client:
+            return False
+        try:
+            self.model_handle
+        except Exception as e:
+            logger.error(f"Failed to load {self.provider} model {self.model}: {e}")
+            return False
+        return True
+        
+    def _request(self, prompt, max_tokens=None):
+        """Call the provider under its shared rate limits, retrying transient errors"""
+        completion = self.registry.complete(self.provider, self.model, prompt, max_tokens or self.max_tokens)
+        span = current_span()
+        span.increment('prompt_tokens', completion.prompt_tokens)
+        span.increment('completion_tokens', completion.completion_tokens)
+        return completion.text
+    
+    def _complete(self, prompt, max_tokens=None):
+        """Return the model response for a prompt, answering from the cache when possible"""
+        if self.cache is None or not self.registry.get(self.provider).cacheable:
+            return self._request(prompt, max_tokens)
+        response = self.cache.get(self.provider, self.model, prompt)
+        current_span().increment('cache_hits' if response is not None else 'cache_misses')
+        if response is None:
+            response = self._request(prompt, max_tokens)
+            self.cache.put(self.provider, self.model, prompt, response)
+        return response
         
     @abstractmethod
     def analyze_triple(self, triple, context):
         pass
     
     @abstractmethod
-    def participate_in_discussion(self, other_agents_reasoning):
+    def participate_in_discussion(self, triple, context, discussion_points):
         pass
 
-class HeadForwardAgent(BaseAgent):
-    def __init__(self):
-        super().__init__("Head Forward Agent")
+def _confidence(value):
+    """Confidence as a float in [0, 1] from a number, a percentage ("85%") or a fraction ("8/10").
+
+    Raises ValueError for anything else above 1, such as a bare 85 or 1.5,
+    rather than guessing its scale.
+    """
+    text = str(value).strip()
+    if text.endswith('%'):
+        confidence = float(text[:-1]) / 100
+    elif '/' in text:
+        numerator, denominator = text.split('/', 1)
+        confidence = float(numerator) / float(denominator)
+    else:
+        confidence = float(text)
+    if not 0 <= confidence <= 1:
+        raise ValueError(f"confidence {value!r} is outside [0, 1]")
+    return confidence
+
+def parse_verdict(text):
+    """Read (verdict, confidence, reasoning) from a response, or None if it gives no verdict.
+
+    Takes the last JSON object with a "valid" or "error" verdict and a
+    readable confidence, possibly inside prose or a code fence. Falls back to
+    "verdict: ..." and "confidence: ..." phrases, with the whole response as
+    reasoning.
+    """
+    for match in reversed(list(_JSON_OBJECT.finditer(text))):
         try:
-            self.client = openai.OpenAI(api_key=OPENAI_API_KEY)
+            item = json.loads(match.group(0))
+            verdict = str(item['verdict']).strip().lower()
+            confidence = _confidence(item['confidence'])
+        except (json.JSONDecodeError, KeyError, TypeError, ValueError, ZeroDivisionError):
+            continue
+        if verdict in ('valid', 'error'):
+            reasoning = str(item.get('reasoning') or '').strip() or text[:match.start()].strip()
+            return verdict, confidence, reasoning
+    verdict, confidence = _VERDICT_PHRASE.search(text), _CONFIDENCE_PHRASE.search(text)
+    if verdict is None or confidence is None:
+        return None
+    try:
+        return verdict.group(1).lower(), _confidence(confidence.group(1)), text.strip()
+    except (ValueError, ZeroDivisionError):
+        return None
+
+# A confidence number, percentage or fraction
+_CONFIDENCE_VALUE = r'(\d*\.?\d+\s*(?:%|/\s*\d*\.?\d+)?)'
+_JSON_OBJECT = re.compile(r'\{[^{}]*\}')
+_VERDICT_PHRASE = re.compile(r'\bverdict\W+(valid|error)\b', re.IGNORECASE)
+_CONFIDENCE_PHRASE = re.compile(r'\bconfidence\W+' + _CONFIDENCE_VALUE, re.IGNORECASE)
+
+def parse_packed_response(text, count):
+    """Map a packed response back to [(verdict, confidence, reasoning) or None] per triple.
+
+    Expects a JSON array of {"id", "verdict", "confidence", "reasoning"}
+    objects, possibly wrapped in prose or a code fence. Only "valid" and
+    "error" verdicts count; any other verdict leaves the triple unparsed.
+    Falls back to reading "<id>. ... verdict: <verdict> ... confidence:
+    <confidence>" lines when the JSON is malformed; lines without both
+    labels leave their triple unparsed.
+    """
+    results = [None] * count
+    start, end = text.find('['), text.rfind(']')
+    try:
+        items = json.loads(text[start:end + 1]) if start != -1 and end > start else []
+    except json.JSONDecodeError:
+        items = []
+    for item in items:
+        try:
+            index = int(item['id']) - 1
+            verdict = str(item.get('verdict', '')).strip().lower()
+            confidence = _confidence(item['confidence'])
+        except (KeyError, TypeError, ValueError, ZeroDivisionError):
+            continue
+        if 0 <= index < count and verdict in ('valid', 'error'):
+            results[index] = (verdict, confidence, str(item.get('reasoning', '')).strip())
+    if any(result is None for result in results):
+        for match in _PACKED_LINE.finditer(text):
+            index = int(match.group(1)) - 1
+            if 0 <= index < count and results[index] is None:
+                try:
+                    confidence = _confidence(match.group(3))
+                except (ValueError, ZeroDivisionError):
+                    continue
+                results[index] = (match.group(2).lower(), confidence, match.group(0).strip())
+    return results
+
+_PACKED_LINE = re.compile(
+    r'^\W*(\d+)\W.*?\bverdict\W+(valid|error)\b.*?\bconfidence\W+' + _CONFIDENCE_VALUE + '.*$',
+    re.IGNORECASE | re.MULTILINE
+)
+
+class PerspectiveAgent(BaseAgent):
+    """Agent that judges triples from one directional neighborhood of the graph.
+
+    Besides analyzing one triple at a time, it can analyze a group of triples
+    sharing the entity it looks at in a single packed request.
+    """
+
+    @property
+    def perspective_name(self):
+        position, direction = self.perspective
+        return f"{position}-{'forward' if direction == 'out' else 'backward'}"
+
+    def _judge(self, prompt):
+        """Ask for a structured verdict on prompt; an unreadable answer counts as undecided"""
+        response = self._complete(prompt + VERDICT_FORMAT)
+        parsed = parse_verdict(response)
+        if parsed is None:
+            logger.warning(f"No verdict in {self.name} response, treating it as undecided")
+            return None, 0.5, response
+        return parsed
+
+    def participate_in_discussion(self, triple, context, discussion_points):
+        """Revise the analysis of triple after a discussion round; context holds its neighborhood"""
+        if not self.client:
+            logger.warning(f"{self.provider} client not initialized. Using fallback analysis.")
+            return None, 0.5, "API unavailable - using fallback analysis"
+
+        position, direction = self.perspective
+        prompt = DISCUSSION_PROMPT_TEMPLATE.format(
+            perspective=self.perspective_name,
+            triple=triple,
+            position=position,
+            role='subject' if direction == 'out' else 'object',
+            neighborhood=context['neighborhood'],
+            points=discussion_points
+        )
+        try:
+            verdict, confidence, reasoning = self._judge(prompt)
+        except Exception as e:
+            logger.error(f"Error in {self.provider} API call: {e}")
+            verdict, confidence, reasoning = None, 0.5, "API error occurred"
+
+        self.verdict, self.confidence, self.reasoning = verdict, confidence, reasoning
+        return verdict, confidence, reasoning
+
+    def packed_group_size(self, neighborhood):
+        """Largest group that fits the model's context window and the packed output budget"""
+        window = MODEL_CONTEXT_WINDOWS.get(self.model, DEFAULT_CONTEXT_WINDOW)
+        overhead = estimate_tokens(PACKED_PROMPT_TEMPLATE) + estimate_tokens(neighborhood)
+        by_input = (window - PACKED_MAX_OUTPUT_TOKENS - overhead) // PACKED_TOKENS_PER_TRIPLE
+        by_output = PACKED_MAX_OUTPUT_TOKENS // PACKED_TOKENS_PER_VERDICT
+        return max(1, min(PACKED_MAX_GROUP_SIZE, by_input, by_output))
+
+    def analyze_triples(self, triples, neighborhood):
+        """Analyze triples sharing this agent's entity in one request.
+
+        Returns (verdict, confidence, reasoning) per triple, in order. Triples
+        missing from the response are undecided, like after an API error.
+        """
+        if not self.client:
+            logger.warning(f"{self.provider} client not initialized. Using fallback analysis.")
+            return [(None, 0.5, "API unavailable - using fallback analysis")] * len(triples)
+
+        position, direction = self.perspective
+        prompt = PACKED_PROMPT_TEMPLATE.format(
+            perspective=self.perspective_name,
+            position=position,
+            role='subject' if direction == 'out' else 'object',
+            neighborhood=neighborhood,
+            triples="\n".join(f"{i}. {triple}" for i, triple in enumerate(triples, 1))
+        )
+        try:
+            response = self._complete(prompt, max_tokens=PACKED_MAX_OUTPUT_TOKENS)
         except Exception as e:
-            logger.error(f"Failed to initialize OpenAI client: {e}")
-            self.client = None
+            logger.error(f"Error in {self.provider} API call: {e}")
+            return [(None, 0.5, "API error occurred")] * len(triples)
+
+        return [
+            parsed or (None, 0.5, "No verdict for this triple in the packed response")
+            for parsed in parse_packed_response(response, len(triples))
+        ]
+
+class HeadForwardAgent(PerspectiveAgent):
+    perspective = ('head', 'out')
+    role = 'hfa'
+
+    def __init__(self, registry=None, use_cache=True):
+        super().__init__("Head Forward Agent", registry, use_cache)
         
     def analyze_triple(self, triple, context):
         if not self.client:
-            logger.warning("OpenAI client not initialized. Using fallback analysis.")
-            return 0.5, "API unavailable - using fallback analysis"
+            logger.warning(f"{self.provider} client not initialized. Using fallback analysis.")
+            return None, 0.5, "API unavailable - using fallback analysis"
             
         try:
             prompt = f"""Analyze the following knowledge graph triple from a head-forward perspective:
             Triple: {triple}
-            Context: {context}
+            Known triples where the head entity is the subject:
+            {context['neighborhood']}
             Focus on how the head entity relates to other entities in forward direction.
             Is this triple likely to be correct? Provide reasoning."""
             
-            response = self.client.chat.completions.create(
-                model="gpt-4-turbo-preview",
-                messages=[{"role": "user", "content": prompt}]
-            )
-            
-            self.reasoning = response.choices[0].message.content
-            self.confidence = 0.9
+            verdict, confidence, reasoning = self._judge(prompt)
         except Exception as e:
-            logger.error(f"Error in OpenAI API call: {e}")
-            self.reasoning = "API error occurred"
-            self.confidence = 0.5
+            logger.error(f"Error in {self.provider} API call: {e}")
+            verdict, confidence, reasoning = None, 0.5, "API error occurred"
             
-        return self.confidence, self.reasoning
+        self.verdict, self.confidence, self.reasoning = verdict, confidence, reasoning
+        return verdict, confidence, reasoning
 
-    def participate_in_discussion(self, other_agents_reasoning):
-        if not self.client:
-            logger.warning("OpenAI client not initialized. Using fallback analysis.")
-            return 0.5, "API unavailable - using fallback analysis"
-            
-        try:
-            prompt = f"""Based on the discussion points raised by other agents:
-            {other_agents_reasoning}
-            
-            Revise your analysis if necessary. Consider the points raised by other agents and provide updated reasoning."""
-            
-            response = self.client.chat.completions.create(
-                model="gpt-4-turbo-preview",
-                messages=[{"role": "user", "content": prompt}]
-            )
-            
-            self.reasoning = response.choices[0].message.content
-            self.confidence = 0.9
-        except Exception as e:
-            logger.error(f"Error in OpenAI API call: {e}")
-            self.reasoning = "API error occurred"
-            self.confidence = 0.5
-            
-        return self.confidence, self.reasoning
+class HeadBackwardAgent(PerspectiveAgent):
+    perspective = ('head', 'in')
+    role = 'hba'
 
-class HeadBackwardAgent(BaseAgent):
-    def __init__(self):
-        super().__init__("Head Backward Agent")
-        try:
-            self.client = anthropic.Client(api_key=ANTHROPIC_API_KEY)
-        except Exception as e:
-            logger.error(f"Failed to initialize Anthropic client: {e}")
-            self.client = None
+    def __init__(self, registry=None, use_cache=True):
+        super().__init__("Head Backward Agent", registry, use_cache)
         
     def analyze_triple(self, triple, context):
         if not self.client:
-            logger.warning("Anthropic client not initialized. Using fallback analysis.")
-            return 0.5, "API unavailable - using fallback analysis"
+            logger.warning(f"{self.provider} client not initialized. Using fallback analysis.")
+            return None, 0.5, "API unavailable - using fallback analysis"
             
         try:
             prompt = f"""Analyze the following knowledge graph triple from a head-backward perspective:
             Triple: {triple}
-            Context: {context}
+            Known triples where the head entity is the object:
+            {context['neighborhood']}
             Focus on how other entities relate to the head entity."""
             
-            response = self.client.messages.create(
-                model="claude-3-opus-20240229",
-                max_tokens=1000,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            
-            self.reasoning = response.content[0].text
-            self.confidence = 0.85
+            verdict, confidence, reasoning = self._judge(prompt)
         except Exception as e:
-            logger.error(f"Error in Anthropic API call: {e}")
-            self.reasoning = "API error occurred"
-            self.confidence = 0.5
+            logger.error(f"Error in {self.provider} API call: {e}")
+            verdict, confidence, reasoning = None, 0.5, "API error occurred"
             
-        return self.confidence, self.reasoning
+        self.verdict, self.confidence, self.reasoning = verdict, confidence, reasoning
+        return verdict, confidence, reasoning
 
-    def participate_in_discussion(self, other_agents_reasoning):
-        if not self.client:
-            logger.warning("Anthropic client not initialized. Using fallback analysis.")
-            return 0.5, "API unavailable - using fallback analysis"
-            
-        try:
-            prompt = f"""Based on the discussion points raised by other agents:
-            {other_agents_reasoning}
-            
-            Revise your analysis if necessary. Consider the points raised by other agents and provide updated reasoning."""
-            
-            response = self.client.messages.create(
-                model="claude-3-opus-20240229",
-                max_tokens=1000,
-                messages=[{"role": "user", "content": prompt}]
-            )
-            
-            self.reasoning = response.content[0].text
-            self.confidence = 0.85
-        except Exception as e:
-            logger.error(f"Error in Anthropic API call: {e}")
-            self.reasoning = "API error occurred"
-            self.confidence = 0.5
-            
-        return self.confidence, self.reasoning
+class TailForwardAgent(PerspectiveAgent):
+    perspective = ('tail', 'out')
+    role = 'tfa'
 
-class TailForwardAgent(BaseAgent):
-    def __init__(self):
-        super().__init__("Tail Forward Agent")
-        try:
-            self.client = cohere.Client(COHERE_API_KEY)
-        except Exception as e:
-            logger.error(f"Failed to initialize Cohere client: {e}")
-            self.client = None
+    def __init__(self, registry=None, use_cache=True):
+        super().__init__("Tail Forward Agent", registry, use_cache)
         
     def analyze_triple(self, triple, context):
         if not self.client:
-            logger.warning("Cohere client not initialized. Using fallback analysis.")
-            return 0.5, "API unavailable - using fallback analysis"
+            logger.warning(f"{self.provider} client not initialized. Using fallback analysis.")
+            return None, 0.5, "API unavailable - using fallback analysis"
             
         try:
             prompt = f"""Analyze the following knowledge graph triple from a tail-forward perspective:
             Triple: {triple}
-            Context: {context}
+            Known triples where the tail entity is the subject:
+            {context['neighborhood']}
             Focus on how the tail entity relates to other entities in forward direction."""
             
-            response = self.client.chat(
-                message=prompt,
-                model='command'
-            )
-            
-            self.reasoning = response.text
-            self.confidence = 0.88
+            verdict, confidence, reasoning = self._judge(prompt)
         except Exception as e:
-            logger.error(f"Error in Cohere API call: {e}")
-            self.reasoning = "API error occurred"
-            self.confidence = 0.5
+            logger.error(f"Error in {self.provider} API call: {e}")
+            verdict, confidence, reasoning = None, 0.5, "API error occurred"
             
-        return self.confidence, self.reasoning
+        self.verdict, self.confidence, self.reasoning = verdict, confidence, reasoning
+        return verdict, confidence, reasoning
 
-    def participate_in_discussion(self, other_agents_reasoning):
-        if not self.client:
-            logger.warning("Cohere client not initialized. Using fallback analysis.")
-            return 0.5, "API unavailable - using fallback analysis"
-            
-        try:
-            prompt = f"""Based on the discussion points raised by other agents:
-            {other_agents_reasoning}
-            
-            Revise your analysis if necessary. Consider the points raised by other agents and provide updated reasoning."""
-            
-            response = self.client.chat(
-                message=prompt,
-                model='command'
-            )
-            
-            self.reasoning = response.text
-            self.confidence = 0.88
-        except Exception as e:
-            logger.error(f"Error in Cohere API call: {e}")
-            self.reasoning = "API error occurred"
-            self.confidence = 0.5
-            
-        return self.confidence, self.reasoning
+class TailBackwardAgent(PerspectiveAgent):
+    perspective = ('tail', 'in')
+    role = 'tba'
 
-class TailBackwardAgent(BaseAgent):
-    def __init__(self):
-        super().__init__("Tail Backward Agent")
-        try:
-            aiplatform.init(project="your-project-id")
-            self.initialized = True
-        except Exception as e:
-            logger.error(f"Failed to initialize Google AI Platform: {e}")
-            self.initialized = False
+    def __init__(self, registry=None, use_cache=True):
+        super().__init__("Tail Backward Agent", registry, use_cache)
         
     def analyze_triple(self, triple, context):
-        if not self.initialized:
-            logger.warning("Google AI Platform not initialized. Using fallback analysis.")
-            return 0.5, "API unavailable - using fallback analysis"
+        if not self.client:
+            logger.warning(f"{self.provider} client not initialized. Using fallback analysis.")
+            return None, 0.5, "API unavailable - using fallback analysis"
             
         try:
             prompt = f"""Analyze the following knowledge graph triple from a tail-backward perspective:
             Triple: {triple}
-            Context: {context}
+            Known triples where the tail entity is the object:
+            {context['neighborhood']}
             Focus on how other entities relate to the tail entity."""
             
-            model = aiplatform.TextGenerationModel.from_pretrained("text-bison@002")
-            response = model.predict(prompt)
-            
-            self.reasoning = response.text
-            self.confidence = 0.87
-        except Exception as e:
-            logger.error(f"Error in Google AI Platform API call: {e}")
-            self.reasoning = "API error occurred"
-            self.confidence = 0.5
-            
-        return self.confidence, self.reasoning
-
-    def participate_in_discussion(self, other_agents_reasoning):
-        if not self.initialized:
-            logger.warning("Google AI Platform not initialized. Using fallback analysis.")
-            return 0.5, "API unavailable - using fallback analysis"
-            
-        try:
-            prompt = f"""Based on the discussion points raised by other agents:
-            {other_agents_reasoning}
-            
-            Revise your analysis if necessary. Consider the points raised by other agents and provide updated reasoning."""
-            
-            model = aiplatform.TextGenerationModel.from_pretrained("text-bison@002")
-            response = model.predict(prompt)
-            
-            self.reasoning = response.text
-            self.confidence = 0.87
+            verdict, confidence, reasoning = self._judge(prompt)
         except Exception as e:
-            logger.error(f"Error in Google AI Platform API call: {e}")
-            self.reasoning = "API error occurred"
-            self.confidence = 0.5
+            logger.error(f"Error in {self.provider} API call: {e}")
+            verdict, confidence, reasoning = None, 0.5, "API error occurred"
             
-        return self.confidence, self.reasoning
+        self.verdict, self.confidence, self.reasoning = verdict, confidence, reasoning
+        return verdict, confidence, reasoning
 
 class DiscussionFacilitator(BaseAgent):
-    def __init__(self):
-        super().__init__("Discussion Facilitator")
-        try:
-            self.client = openai.OpenAI(api_key=OPENAI_API_KEY)
-        except Exception as e:
-            logger.error(f"Failed to initialize OpenAI client: {e}")
-            self.client = None
+    role = 'df'
+
+    def __init__(self, registry=None, use_cache=True):
+        super().__init__("Discussion Facilitator", registry, use_cache)
         
     def analyze_triple(self, triple, context):
-        return 0.0, ""
+        return None, 0.0, ""
         
-    def facilitate_discussion(self, agent_reasonings):
+    def facilitate_discussion(self, triple, agent_reasonings):
+        """Discussion points for the agents' reasonings about triple, or None if facilitation failed"""
         if not self.client:
-            logger.warning("OpenAI client not initialized. Using simplified facilitation.")
-            return "Discussion facilitation unavailable due to API issues."
+            logger.warning(f"{self.provider} client not initialized. Skipping facilitation.")
+            return None
             
         try:
-            prompt = f"""As a Discussion Facilitator, analyze the following agent reasonings and guide the discussion:
-            Agent Reasonings: {agent_reasonings}
+            template = """As a Discussion Facilitator, analyze the following agent reasonings about a knowledge graph triple and guide the discussion:
+            Triple: {triple}
+            Agent Reasonings: {reasonings}
             Identify key points of agreement and disagreement, and suggest focus areas for the next round."""
+            budget = FACILITATOR_MAX_PROMPT_TOKENS - estimate_tokens(template.format(triple=triple, reasonings=''))
+            prompt = template.format(triple=triple, reasonings=render_agent_results(agent_reasonings, budget))
             
-            response = self.client.chat.completions.create(
-                model="gpt-4-turbo-preview",
-                messages=[{"role": "user", "content": prompt}]
-            )
-            
-            return response.choices[0].message.content
+            return self._complete(prompt)
         except Exception as e:
-            logger.error(f"Error in OpenAI API call: {e}")
-            return "Discussion facilitation encountered an error."
+            logger.error(f"Error in {self.provider} API call: {e}")
+            return None
 
-    def participate_in_discussion(self, other_agents_reasoning):
+    def participate_in_discussion(self, triple, context, discussion_points):
         pass  # DiscussionFacilitator does not participate in discussion
 
 class SummarizerDecisionMaker(BaseAgent):
-    def __init__(self):
-        super().__init__("Summarizer & Decision Maker")
-        try:
-            self.client = anthropic.Client(api_key=ANTHROPIC_API_KEY)
-        except Exception as e:
-            logger.error(f"Failed to initialize Anthropic client: {e}")
-            self.client = None
+    role = 'sdm'
+
+    def __init__(self, registry=None, use_cache=True):
+        super().__init__("Summarizer & Decision Maker", registry, use_cache)
         
     def analyze_triple(self, triple, context):
-        return 0.0, ""
+        return None, 0.0, ""
         
-    def make_decision(self, discussion_history):
+    def make_decision(self, triple, neighborhood, discussion_history):
+        """Decide on triple from its neighborhood and a DiscussionHistory, within DECISION_MAX_PROMPT_TOKENS.
+
+        The neighborhood gets at most a quarter of the budget. The response
+        ends with a structured verdict, see parse_verdict.
+        """
         if not self.client:
-            logger.warning("Anthropic client not initialized. Using simplified decision making.")
+            logger.warning(f"{self.provider} client not initialized. Using simplified decision making.")
             return "Decision making unavailable due to API issues."
             
         try:
-            prompt = f"""As the Summarizer & Decision Maker, analyze the following discussion history and make a final decision:
-            Discussion History: {discussion_history}
+            template = """As the Summarizer & Decision Maker, analyze the following discussion history about a knowledge graph triple and make a final decision:
+            Triple: {triple}
+            Known triples around its head and tail entities:
+{neighborhood}
+            Discussion History:
+{history}
             Provide a clear decision with comprehensive reasoning."""
-            
-            response = self.client.messages.create(
-                model="claude-3-opus-20240229",
-                max_tokens=1000,
-                messages=[{"role": "user", "content": prompt}]
+            budget = DECISION_MAX_PROMPT_TOKENS - estimate_tokens(
+                template.format(triple=triple, neighborhood='', history='') + VERDICT_FORMAT
             )
+            neighborhood = truncate_to_tokens(neighborhood, budget // 4)
+            history = discussion_history.render(budget - estimate_tokens(neighborhood))
+            prompt = template.format(triple=triple, neighborhood=neighborhood, history=history) + VERDICT_FORMAT
             
-            return response.content[0].text
+            return self._complete(prompt)
         except Exception as e:
-            logger.error(f"Error in Anthropic API call: {e}")
+            logger.error(f"Error in {self.provider} API call: {e}")
             return "Decision making encountered an error."
 
-    def participate_in_discussion(self, other_agents_reasoning):
+    def participate_in_discussion(self, triple, context, discussion_points):
         # SummarizerDecisionMaker does not participate in discussion
-        return 0.0, ""
+        return None, 0.0, ""
@@ -0,0 +1,176 @@
+"""Offline benchmark of the MAKGED pipeline.
+
+All agents run against MockProvider backends, so the numbers measure the
+framework itself (GCN, prompt building, discussion loop, voting) and can be
+compared across commits in CI without network access or API keys:
+
+    python benchmark.py --sizes 100 1000 10000 --triples 200 --json bench.json
+
+Each configuration runs in a fresh process, so its peak RSS is its own.
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import random
+import resource
+import statistics
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from config import AGENT_PROVIDERS, EMBEDDING_PROVIDER
+from graph_data import build_graph_context
+from makged import MAKGED
+from providers import ProviderRegistry, MockProvider
+
+# Attribute relations and value pools in the style of create_sample_knowledge_graph
+ATTRIBUTE_VALUES = {
+    'network support': ['3G', '4G', '5G'],
+    'processor': ['Kirin 970', 'Kirin 980', 'Snapdragon 845', 'Exynos 9810', 'A11 Bionic'],
+    'operating system': ['Android 8.1', 'Android 9', 'Android 10', 'iOS 11'],
+    'RAM': ['3GB RAM', '4GB RAM', '6GB RAM', '8GB RAM'],
+    'storage': ['32GB Storage', '64GB Storage', '128GB Storage', '256GB Storage'],
+    'manufacturer': ['Huawei', 'Samsung', 'Xiaomi', 'Apple', 'OnePlus']
+}
+
+def create_synthetic_knowledge_graph(num_products, seed=0):
+    """Triples describing num_products phones, each with one value per attribute"""
+    rng = random.Random(seed)
+    triples = []
+    for i in range(num_products):
+        product = f"Phone {i}"
+        for relation, values in ATTRIBUTE_VALUES.items():
+            triples.append((product, relation, rng.choice(values)))
+    return triples
+
+def sample_test_triples(triples, num_triples, error_fraction=0.3, seed=0):
+    """Mix of triples from the graph and ones with a corrupted tail"""
+    rng = random.Random(seed)
+    sample = []
+    for _ in range(num_triples):
+        head, relation, tail = rng.choice(triples)
+        if rng.random() < error_fraction:
+            tail = rng.choice([v for v in ATTRIBUTE_VALUES[relation] if v != tail])
+        sample.append((head, relation, tail))
+    return sample
+
+def mock_registry(latency=None, error_rate=0.0, seed=0):
+    """Registry whose configured provider names all resolve to mock backends, unthrottled"""
+    registry = ProviderRegistry(rate_limits={}, base_delay=0.01, max_delay=0.1)
+    names = sorted({entry['provider'] for entry in AGENT_PROVIDERS.values()} | {EMBEDDING_PROVIDER})
+    for offset, name in enumerate(names):
+        registry.register(name, MockProvider(latency=latency, error_rate=error_rate, seed=seed + offset))
+    return registry
+
+class TimedMAKGED(MAKGED):
+    """MAKGED that records the latency of every triple it decides.
+
+    Triples decided by detect_error count the time of their analysis; triples
+    whose packed results reach consensus count the time of their window's
+    packed call, since that is how long each of them waited for a result.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+        self._latency_lock = threading.Lock()
+
+    def _keep_result(self, triple, graph_context, result, rounds, latency):
+        with self._latency_lock:
+            self.latencies.append(latency)
+        super()._keep_result(triple, graph_context, result, rounds, latency)
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def _ms(seconds):
+    return None if seconds is None else 1000 * seconds
+
+def _format_ms(value):
+    return f"{'-':>9}" if value is None else f"{value:>9.1f}"
+
+def run_benchmark(num_products, num_triples, mode='batch', concurrency=8, latency=None,
+                  error_rate=0.0, seed=0):
+    """Run one configuration and return its metrics"""
+    triples = create_synthetic_knowledge_graph(num_products, seed)
+    graph_context = build_graph_context(triples, node_features='embedding')
+    test_triples = sample_test_triples(triples, num_triples, seed=seed)
+
+    registry = mock_registry(latency, error_rate, seed)
+    makged = TimedMAKGED(max_concurrency=concurrency, registry=registry, use_cache=False)
+    makged.initialize_gcn(graph_context['num_features'], graph_context['num_embeddings'])
+
+    start = time.perf_counter()
+    if mode in ('batch', 'packed'):
+        for _ in makged.detect_errors(test_triples, graph_context, packed=mode == 'packed'):
+            pass
+    else:
+        for triple in test_triples:
+            makged.detect_error(triple, graph_context)
+    elapsed = time.perf_counter() - start
+    makged.close()
+
+    return {
+        'mode': mode,
+        'entities': len(graph_context['node_to_id']),
+        'edges': graph_context['edge_index'].shape[1],
+        'triples': num_triples,
+        'triples_per_sec': num_triples / elapsed,
+        'p50_latency_ms': _ms(statistics.median(makged.latencies) if makged.latencies else None),
+        'p99_latency_ms': _ms(_percentile(makged.latencies, 0.99)),
+        'calls_per_triple': registry.stats['calls'] / num_triples,
+        'retries': registry.stats['retries'],
+        # ru_maxrss is reported in kilobytes on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    }
+
+def _quiet():
+    logging.getLogger().setLevel(logging.ERROR)
+
+def run_isolated(*args):
+    """run_benchmark in a fresh process, so peak RSS is not carried over from earlier runs"""
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_quiet) as pool:
+        return pool.submit(run_benchmark, *args).result()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark MAKGED against mock LLM backends")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 1000, 10000],
+                        help="Number of products in each synthetic graph")
+    parser.add_argument('--triples', type=int, default=100, help="Triples analyzed per graph")
+    parser.add_argument('--modes', nargs='+', default=['sequential', 'batch'],
+                        choices=['sequential', 'batch', 'packed'])
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--latency-ms', type=float, default=0.0, help="Median mock call latency")
+    parser.add_argument('--latency-sigma', type=float, default=0.5,
+                        help="Log-normal spread of the mock latency")
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', help="Write results as JSON to this path")
+    args = parser.parse_args()
+
+    _quiet()
+    latency = (args.latency_ms / 1000, args.latency_sigma) if args.latency_ms else None
+
+    results = []
+    print(f"{'mode':<11}{'entities':>10}{'edges':>10}{'triples/s':>11}{'p50 ms':>9}"
+          f"{'p99 ms':>9}{'calls/triple':>14}{'peak RSS MB':>13}")
+    for size in args.sizes:
+        for mode in args.modes:
+            result = run_isolated(size, args.triples, mode, args.concurrency, latency,
+                                  args.error_rate, args.seed)
+            results.append(result)
+            print(f"{mode:<11}{result['entities']:>10}{result['edges']:>10}"
+                  f"{result['triples_per_sec']:>11.1f}{_format_ms(result['p50_latency_ms'])}"
+                  f"{_format_ms(result['p99_latency_ms'])}{result['calls_per_triple']:>14.2f}"
+                  f"{result['peak_rss_mb']:>13.1f}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,3 +1,4 @@
+import json
 import os
 from dotenv import load_dotenv
 
@@ -11,13 +12,102 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GOOGLE_API_KEY = os.getenv("GOOGLE_API_KEY")
 COHERE_API_KEY = os.getenv("COHERE_API_KEY")
 EMERGENCEAI_API_KEY = os.getenv("EMERGENCEAI_API_KEY")
+GOOGLE_CLOUD_PROJECT = os.getenv("GOOGLE_CLOUD_PROJECT", "your-project-id")
 
 # Model configurations
 EMBEDDING_MODEL = "text-embedding-3-small"  # OpenAI's text embedding model
+EMBEDDING_PROVIDER = 'openai'  # Provider serving EMBEDDING_MODEL
+EMBEDDING_BATCH_SIZE = 512  # Texts embedded per request
 GCN_HIDDEN_CHANNELS = 64
+NODE_FEATURES = "sparse"  # GCN input: "sparse" or "identity" one-hot, or learned "embedding"
+NODE_EMBEDDING_DIM = 64  # Input size per node when NODE_FEATURES is "embedding"
 GCN_NUM_LAYERS = 3
+EMBEDDING_CACHE_SIZE = 4  # Graph versions whose GCN embeddings are kept in memory
+
+# In-memory GCN inference (models.GCNEncoder.prepare_inference)
+GCN_INFERENCE_DTYPE = os.getenv("MAKGED_GCN_DTYPE", "float32")  # "bfloat16" or "int8" trade accuracy for speed
+GCN_COMPILE = os.getenv("MAKGED_GCN_COMPILE", "0") == "1"  # Run the layers through torch.compile
+GCN_WEIGHTS_PATH = os.getenv("MAKGED_GCN_WEIGHTS")  # Trained weights initialize_gcn loads, if set
+
+# Layer-wise GCN inference to disk, for graphs whose activations exceed memory
+GCN_INFERENCE_BATCH_SIZE = 65_536  # Target nodes computed per task
+GCN_INFERENCE_EDGE_CHUNK = 1_000_000  # Incoming edges gathered at once within a task
+GCN_INFERENCE_WORKERS = 4  # Worker processes, 0 to run in the calling process
+
+# Provider quotas shared by all agents using a provider (None disables a limit)
+PROVIDER_RATE_LIMITS = {
+    'openai': {'requests_per_minute': 500, 'tokens_per_minute': 300_000},
+    'anthropic': {'requests_per_minute': 50, 'tokens_per_minute': 40_000},
+    'cohere': {'requests_per_minute': 100, 'tokens_per_minute': None},
+    'vertex': {'requests_per_minute': 60, 'tokens_per_minute': None}
+}
+PROVIDER_MAX_RETRIES = 5  # Retries of rate-limited or transient provider errors
+PROVIDER_RETRY_BASE_DELAY = 1.0  # Seconds, doubled per attempt with full jitter
+PROVIDER_RETRY_MAX_DELAY = 60.0
+
+# LLM response cache shared by all agents
+LLM_CACHE_ENABLED = os.getenv("MAKGED_LLM_CACHE", "1") != "0"
+LLM_CACHE_PATH = os.getenv("MAKGED_LLM_CACHE_PATH", ".makged_cache/responses.sqlite")
+LLM_CACHE_TTL_SECONDS = 7 * 24 * 3600  # Responses older than this are fetched again
+LLM_CACHE_MAX_ENTRIES = 100_000  # Least recently used responses are evicted beyond this
+
+# Append-only store of detection results, used to skip triples judged in earlier runs
+RESULTS_STORE_PATH = os.getenv("MAKGED_RESULTS_STORE_PATH", ".makged_cache/results.sqlite")
+
+# On-disk store of GCN and semantic embeddings, memory-mapped on load
+EMBEDDING_STORE_ENABLED = os.getenv("MAKGED_EMBEDDING_STORE", "1") != "0"
+EMBEDDING_STORE_PATH = os.getenv("MAKGED_EMBEDDING_STORE_PATH", ".makged_cache/embeddings")
+EMBEDDING_STORE_DTYPE = "float16"  # "float16" halves the size, "float32" is exact
+
+# Neighborhood context given to the directional agents
+SUBGRAPH_NUM_HOPS = 1  # Hops followed from the head or tail entity
+SUBGRAPH_MAX_FANOUT = 20  # Edges expanded per node and hop
+
+# Packed mode: one request per group of triples sharing an entity
+MODEL_CONTEXT_WINDOWS = {
+    'gpt-4-turbo-preview': 128_000,
+    'claude-3-opus-20240229': 200_000,
+    'command': 4_096,
+    'text-bison@002': 8_192
+}
+DEFAULT_CONTEXT_WINDOW = 4_096  # Assumed for models not listed above
+PACKED_MAX_GROUP_SIZE = 32  # Upper bound on triples per packed request
+PACKED_MAX_OUTPUT_TOKENS = 2_048  # Completion budget of a packed request
+PACKED_TOKENS_PER_TRIPLE = 40  # Prompt tokens reserved per listed triple
+PACKED_TOKENS_PER_VERDICT = 80  # Completion tokens reserved per triple's verdict
+PACKED_WINDOW = 256  # Triples pulled from the stream and grouped at once
+
+# Provider and model each agent runs on. Any name registered with the
+# ProviderRegistry works; MAKGED_AGENT_PROVIDERS can override entries with a
+# JSON object, e.g. '{"hfa": {"provider": "anthropic", "model": "claude-3-opus-20240229"}}'
+AGENT_PROVIDERS = {
+    'hfa': {'provider': 'openai', 'model': 'gpt-4-turbo-preview'},
+    'hba': {'provider': 'anthropic', 'model': 'claude-3-opus-20240229'},
+    'tfa': {'provider': 'cohere', 'model': 'command'},
+    'tba': {'provider': 'vertex', 'model': 'text-bison@002'},
+    'df': {'provider': 'openai', 'model': 'gpt-4-turbo-preview'},
+    'sdm': {'provider': 'anthropic', 'model': 'claude-3-opus-20240229'}
+}
+AGENT_PROVIDERS.update(json.loads(os.getenv("MAKGED_AGENT_PROVIDERS", "{}")))
 
 # Agent configurations
 MAX_DISCUSSION_ROUNDS = 3
 CONFIDENCE_THRESHOLD = 0.8  # Threshold for immediate consensus
 VOTING_THRESHOLD = 0.5  # Threshold for majority decision
+DISCUSSION_CALL_BUDGET = None  # Agent calls per triple before the SDM decides early, None for no limit
+DISCUSSION_TIME_BUDGET = None  # Seconds per triple before the SDM decides early, None for no limit
+FACILITATOR_MAX_PROMPT_TOKENS = 4_000  # Hard cap on a Discussion Facilitator prompt
+DECISION_MAX_PROMPT_TOKENS = 8_000  # Hard cap on a Summarizer & Decision Maker prompt
+REASONING_SUMMARY_CHARS = 200  # Length older rounds' reasoning is cut to in the history
+
+# Batch processing
+MAX_CONCURRENT_TRIPLES = 8  # Triples analyzed at once by detect_errors
+SCREENING_THRESHOLD = 0.5  # Triples scoring below this plausibility go to the agents
+SCREENING_BATCH_SIZE = 1024  # Triples scored per vectorized screening pass
+CHECKPOINT_EVERY = 100  # Completed triples between checkpoints of a validation run
+
+# Sharded runs (sharding.py)
+SHARD_COUNT = 64  # Shards a sharded run partitions its input into, by head entity
+SHARD_LEASE_SECONDS = 300  # A shard whose worker sent no heartbeat for this long is requeued
+SHARD_MAX_ATTEMPTS = 3  # Attempts per shard before it is marked failed
+SHARD_MAX_RESTARTS = 10  # Crashed worker processes a run replaces before it gives up
@@ -0,0 +1,95 @@
+from providers import estimate_tokens
+from config import REASONING_SUMMARY_CHARS
+
+TRUNCATION_MARK = " [...]"
+
+def compact(text, max_chars):
+    """Collapse whitespace and cut text to max_chars, marking the cut"""
+    text = " ".join(str(text).split())
+    if len(text) <= max_chars:
+        return text
+    return text[:max(0, max_chars - len(TRUNCATION_MARK))] + TRUNCATION_MARK
+
+def truncate_to_tokens(text, max_tokens):
+    """Hard cap on the estimated token count of text"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    # estimate_tokens counts about four characters per token
+    return text[:max(0, 4 * (max_tokens - 1) - len(TRUNCATION_MARK))] + TRUNCATION_MARK
+
+def _verdict(verdict):
+    return verdict or 'undecided'
+
+def render_agent_results(agent_results, max_tokens):
+    """One line per agent with its verdict and confidence in full and its reasoning cut to a share of max_tokens"""
+    lines = [
+        f"{name} ({_verdict(result.get('verdict'))}, confidence {result['confidence']:.2f})"
+        for name, result in agent_results.items()
+    ]
+    share = 4 * max_tokens // max(1, len(lines)) - max(map(len, lines), default=0) - 2
+    for i, result in enumerate(agent_results.values()):
+        if result.get('reasoning'):
+            lines[i] += ": " + compact(result['reasoning'], max(0, share))
+    return truncate_to_tokens("\n".join(lines), max_tokens)
+
+class DiscussionHistory:
+    """Discussion rounds of one triple, rendered for prompts within a token budget.
+
+    Every round's verdicts and confidences are always kept. The latest round keeps its
+    facilitator points and reasoning in full, older rounds are cut to
+    REASONING_SUMMARY_CHARS per text. If that is still over budget, the
+    oldest rounds lose their text altogether, then the latest round's texts
+    are cut to equal shares of what is left.
+    """
+
+    def __init__(self):
+        self.rounds = []
+
+    def __len__(self):
+        return len(self.rounds)
+
+    def add_round(self, round, points, agent_results):
+        self.rounds.append({
+            'round': round,
+            'points': points,
+            'verdicts': {name: result.get('verdict') for name, result in agent_results.items()},
+            'confidences': {name: result['confidence'] for name, result in agent_results.items()},
+            'reasoning': {name: result.get('reasoning') for name, result in agent_results.items()}
+        })
+
+    @staticmethod
+    def _render_round(entry, summary_chars=None, with_text=True):
+        votes = ", ".join(
+            f"{name} {_verdict(entry['verdicts'][name])} {conf:.2f}" for name, conf in entry['confidences'].items()
+        )
+        lines = [f"Round {entry['round']} verdicts: {votes}"]
+        if not with_text:
+            return "\n".join(lines)
+        cut = (lambda text: compact(text, summary_chars)) if summary_chars else str
+        if entry['points']:
+            lines.append(f"Facilitator: {cut(entry['points'])}")
+        for name, reasoning in entry['reasoning'].items():
+            if reasoning:
+                lines.append(f"{name}: {cut(reasoning)}")
+        return "\n".join(lines)
+
+    def render(self, max_tokens):
+        """Text of the whole history, at most max_tokens"""
+        if not self.rounds:
+            return "(no discussion)"
+        *older, latest = self.rounds
+        rendered = [self._render_round(entry, REASONING_SUMMARY_CHARS) for entry in older]
+        rendered.append(self._render_round(latest))
+        # Drop the text of the oldest rounds first, keeping their verdicts
+        for i in range(len(older)):
+            if estimate_tokens("\n\n".join(rendered)) <= max_tokens:
+                break
+            rendered[i] = self._render_round(older[i], with_text=False)
+        overflow = estimate_tokens("\n\n".join(rendered)) - max_tokens
+        if overflow > 0:
+            # Share what is left evenly between the latest round's texts
+            texts = [latest['points'], *latest['reasoning'].values()]
+            lengths = [len(str(text)) for text in texts if text]
+            share = max(REASONING_SUMMARY_CHARS, (sum(lengths) - 4 * overflow) // max(1, len(lengths)))
+            rendered[-1] = self._render_round(latest, share)
+        return truncate_to_tokens("\n\n".join(rendered), max_tokens)
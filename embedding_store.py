@@ -0,0 +1,197 @@
+import fcntl
+import json
+import os
+import threading
+import uuid
+from contextlib import contextmanager
+import numpy as np
+from config import EMBEDDING_STORE_ENABLED, EMBEDDING_STORE_PATH, EMBEDDING_STORE_DTYPE
+
+# Rows converted and written at once, so large tables never sit in memory whole
+_WRITE_CHUNK = 65_536
+
+class EmbeddingTable:
+    """One table: a memory-mapped matrix and its key -> row index"""
+
+    def __init__(self, vectors, keys, metadata, generation, keys_bytes):
+        self.vectors = vectors
+        self.index = {key: row for row, key in enumerate(keys)}
+        self.rows = len(keys)
+        self.metadata = metadata
+        self.generation = generation
+        self.keys_bytes = keys_bytes
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, key):
+        return key in self.index
+
+    def get(self, key):
+        """Vector stored for key as float32, or None"""
+        row = self.index.get(key)
+        return None if row is None else self.vectors[row].astype(np.float32)
+
+    def _extend(self, vectors, keys, keys_bytes):
+        # Vectors first: a concurrent get never finds a row the map lacks
+        self.vectors = vectors
+        self.index.update((key, self.rows + i) for i, key in enumerate(keys))
+        self.rows += len(keys)
+        self.keys_bytes = keys_bytes
+
+class EmbeddingStore:
+    """Directory of named vector tables that load zero-copy through mmap.
+
+    A table is three files: <name>.<generation>.vectors holds the rows back to
+    back in float16 or float32, <name>.<generation>.keys lists the key of each
+    row as one JSON string per line (a row's offset is its line number), and
+    <name>.meta.json records the current generation, dtype, dimension, row
+    count and caller metadata. Only the rows and keys counted in the meta file
+    exist; replacing it is what commits a write or append.
+
+    Tables are rewritten whole with write, as a new generation, or grown with
+    append. Several processes can share the directory: every operation holds
+    a lock file, and opened tables pick up rows appended by others.
+    """
+
+    def __init__(self, path=EMBEDDING_STORE_PATH, dtype=EMBEDDING_STORE_DTYPE):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self._tables = {}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    @contextmanager
+    def _locked(self, exclusive):
+        """Hold the thread lock and the lock file shared with other processes"""
+        with self._lock, open(os.path.join(self.path, '.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            yield  # Closing the file releases the lock
+
+    def _file(self, name, suffix, generation=None):
+        if generation is None:
+            return os.path.join(self.path, f"{name}.{suffix}")
+        return os.path.join(self.path, f"{name}.{generation}.{suffix}")
+
+    def _read_meta(self, name):
+        path = self._file(name, 'meta.json')
+        if not os.path.exists(path):
+            return None
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+
+    def _write_meta(self, name, meta):
+        tmp_path = self._file(name, f"meta.json.{os.getpid()}.tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, self._file(name, 'meta.json'))
+
+    @staticmethod
+    def _write_rows(f, vectors, dtype):
+        for start in range(0, len(vectors), _WRITE_CHUNK):
+            f.write(np.ascontiguousarray(vectors[start:start + _WRITE_CHUNK], dtype=dtype).tobytes())
+
+    @staticmethod
+    def _encode_keys(keys):
+        return ''.join(json.dumps(key) + '\n' for key in keys).encode('utf-8')
+
+    def _map(self, name, meta):
+        if meta['rows'] == 0:
+            return np.empty((0, meta['dim']), dtype=meta['dtype'])
+        # Copy-on-write: zero-copy, and writable views for torch never touch the file
+        return np.memmap(self._file(name, 'vectors', meta['generation']), dtype=meta['dtype'], mode='c',
+                         shape=(meta['rows'], meta['dim']))
+
+    def write(self, name, keys, vectors, metadata=None):
+        """Replace table name with one row per key; vectors may itself be a memory map"""
+        keys = list(keys)
+        if len(keys) != len(vectors):
+            raise ValueError(f"{len(keys)} keys for {len(vectors)} vectors")
+        generation = uuid.uuid4().hex
+        with self._locked(exclusive=True):
+            self._tables.pop(name, None)
+            old = self._read_meta(name)
+            with open(self._file(name, 'vectors', generation), 'wb') as f:
+                self._write_rows(f, vectors, self.dtype)
+            encoded = self._encode_keys(keys)
+            with open(self._file(name, 'keys', generation), 'wb') as f:
+                f.write(encoded)
+            self._write_meta(name, {
+                'generation': generation,
+                'dtype': self.dtype.name,
+                'dim': int(vectors.shape[1]),
+                'rows': len(keys),
+                'keys_bytes': len(encoded),
+                'metadata': metadata or {}
+            })
+            if old is not None:
+                # Open maps of the old generation stay valid after the unlink
+                for suffix in ('vectors', 'keys'):
+                    os.remove(self._file(name, suffix, old['generation']))
+
+    def append(self, name, keys, vectors):
+        """Add rows to table name, creating it if needed"""
+        keys = list(keys)
+        if not keys:
+            return
+        with self._locked(exclusive=True):
+            meta = self._read_meta(name)
+            if meta is None:
+                meta = {'generation': uuid.uuid4().hex, 'dtype': self.dtype.name,
+                        'dim': int(vectors.shape[1]), 'rows': 0, 'keys_bytes': 0, 'metadata': {}}
+            dtype = np.dtype(meta['dtype'])
+            # Drop anything an interrupted append wrote past the committed rows
+            with open(self._file(name, 'vectors', meta['generation']), 'ab') as f:
+                f.truncate(meta['rows'] * meta['dim'] * dtype.itemsize)
+                self._write_rows(f, vectors, dtype)
+            encoded = self._encode_keys(keys)
+            with open(self._file(name, 'keys', meta['generation']), 'ab') as f:
+                f.truncate(meta['keys_bytes'])
+                f.write(encoded)
+            grown = dict(meta, rows=meta['rows'] + len(keys), keys_bytes=meta['keys_bytes'] + len(encoded))
+            self._write_meta(name, grown)
+
+            table = self._tables.get(name)
+            if table is not None and table.generation == meta['generation'] and table.rows == meta['rows']:
+                table._extend(self._map(name, grown), keys, grown['keys_bytes'])
+            else:
+                self._tables.pop(name, None)
+
+    def table(self, name):
+        """Open table name, or return None if it does not exist"""
+        with self._locked(exclusive=False):
+            meta = self._read_meta(name)
+            if meta is None:
+                self._tables.pop(name, None)
+                return None
+            table = self._tables.get(name)
+            if table is not None and table.generation == meta['generation']:
+                if table.rows < meta['rows']:
+                    # Rows appended by another process: read only their keys
+                    with open(self._file(name, 'keys', meta['generation']), 'rb') as f:
+                        f.seek(table.keys_bytes)
+                        data = f.read(meta['keys_bytes'] - table.keys_bytes)
+                    table._extend(self._map(name, meta), [json.loads(line) for line in data.splitlines()],
+                                  meta['keys_bytes'])
+                return table
+            keys = []
+            if meta['rows']:
+                with open(self._file(name, 'keys', meta['generation']), 'rb') as f:
+                    keys = [json.loads(line) for line in f.read(meta['keys_bytes']).splitlines()]
+            table = EmbeddingTable(self._map(name, meta), keys, meta['metadata'], meta['generation'],
+                                   meta['keys_bytes'])
+            self._tables[name] = table
+            return table
+
+_shared_store = None
+_shared_store_lock = threading.Lock()
+
+def get_embedding_store():
+    """Return the process-wide embedding store, or None when disabled"""
+    global _shared_store
+    if not EMBEDDING_STORE_ENABLED:
+        return None
+    with _shared_store_lock:
+        if _shared_store is None:
+            _shared_store = EmbeddingStore()
+        return _shared_store
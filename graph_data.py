@@ -0,0 +1,88 @@
+from array import array
+import torch
+from config import NODE_FEATURES, NODE_EMBEDDING_DIM
+from ingest import read_tsv, read_triples
+
+def build_graph_context(triples, node_features=NODE_FEATURES):
+    """Build the graph context used by MAKGED from an iterable of (head, relation, tail).
+
+    Entities and relations are numbered in order of first appearance through
+    dicts, so the whole conversion is a single O(E) pass. node_features selects
+    the GCN input:
+      'embedding': x holds node IDs and the GCN learns a NODE_EMBEDDING_DIM
+                   vector per node (memory O(N * dim))
+      'sparse':    x is a sparse one-hot identity matrix (memory O(N))
+      'identity':  x is a dense one-hot identity matrix, only for small graphs
+    """
+    node_to_id = {}
+    relation_to_id = {}
+    src, dst, rel = array('q'), array('q'), array('q')
+    for head, relation, tail in triples:
+        src.append(node_to_id.setdefault(head, len(node_to_id)))
+        dst.append(node_to_id.setdefault(tail, len(node_to_id)))
+        rel.append(relation_to_id.setdefault(relation, len(relation_to_id)))
+    return _assemble(node_to_id, relation_to_id, src, dst, rel, node_features)
+
+def convert_graph_to_pytorch_geometric(G, node_features=NODE_FEATURES):
+    """Convert a networkx graph whose edges carry a 'relation' attribute"""
+    # Register isolated nodes too, in networkx order
+    node_to_id = {node: i for i, node in enumerate(G.nodes())}
+    relation_to_id = {}
+    src, dst, rel = array('q'), array('q'), array('q')
+    for head, tail, relation in G.edges(data='relation', default='related to'):
+        src.append(node_to_id[head])
+        dst.append(node_to_id[tail])
+        rel.append(relation_to_id.setdefault(relation, len(relation_to_id)))
+    return _assemble(node_to_id, relation_to_id, src, dst, rel, node_features)
+
+def load_edge_list(path, delimiter='\t', node_features=NODE_FEATURES):
+    """Load a graph context straight from a head<delimiter>relation<delimiter>tail file.
+
+    Blank lines and lines starting with '#' are skipped.
+    """
+    return build_graph_context(read_tsv(path, delimiter), node_features)
+
+def load_graph(path, format=None, node_features=NODE_FEATURES):
+    """Load a graph context from a TSV, N-Triples or JSONL triple file"""
+    return build_graph_context(read_triples(path, format), node_features)
+
+def _assemble(node_to_id, relation_to_id, src, dst, rel, node_features):
+    num_nodes = len(node_to_id)
+    edge_index = torch.stack([_to_tensor(src), _to_tensor(dst)])
+    edge_type = _to_tensor(rel)
+
+    num_embeddings = None
+    if node_features == 'embedding':
+        x = torch.arange(num_nodes)
+        num_features = NODE_EMBEDDING_DIM
+        num_embeddings = num_nodes
+    elif node_features == 'sparse':
+        ids = torch.arange(num_nodes)
+        x = torch.sparse_coo_tensor(torch.stack([ids, ids]), torch.ones(num_nodes), (num_nodes, num_nodes),
+                                    is_coalesced=True)
+        num_features = num_nodes
+    elif node_features == 'identity':
+        x = torch.eye(num_nodes)
+        num_features = num_nodes
+    else:
+        raise ValueError(f"Unknown node_features mode: {node_features}")
+
+    relations = [None] * len(relation_to_id)
+    for relation, relation_id in relation_to_id.items():
+        relations[relation_id] = relation
+
+    return {
+        'x': x,
+        'edge_index': edge_index,
+        'edge_type': edge_type,
+        'relations': relations,
+        'node_to_id': node_to_id,
+        'num_features': num_features,
+        'num_embeddings': num_embeddings
+    }
+
+def _to_tensor(values):
+    """Copy an array('q') into a long tensor without going through Python ints"""
+    if not len(values):
+        return torch.empty(0, dtype=torch.long)
+    return torch.frombuffer(values, dtype=torch.long).clone()
@@ -0,0 +1,159 @@
+import json
+import os
+import re
+
+# Subject, predicate and object of an N-Triples statement; the object may be
+# an IRI, a blank node or a literal with an optional language tag or datatype
+_NT_TERM = r'(<[^>]*>|_:\S+|"(?:[^"\\]|\\.)*"(?:@[\w-]+|\^\^<[^>]*>)?)'
+_NT_LINE = re.compile(rf'^\s*{_NT_TERM}\s+{_NT_TERM}\s+{_NT_TERM}\s*\.\s*$')
+
+# ECHAR and UCHAR escapes of N-Triples
+_NT_ESCAPE = re.compile(r'\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))', re.DOTALL)
+_NT_ECHARS = {'t': '\t', 'b': '\b', 'n': '\n', 'r': '\r', 'f': '\f', '"': '"', "'": "'", '\\': '\\'}
+
+def _nt_unescape_match(match):
+    code = match.group(1) or match.group(2)
+    if code is not None:
+        return chr(int(code, 16))
+    char = match.group(3)
+    if char not in _NT_ECHARS:
+        raise ValueError(f"invalid escape \\{char}")
+    return _NT_ECHARS[char]
+
+def _nt_unescape(text):
+    return _NT_ESCAPE.sub(_nt_unescape_match, text) if '\\' in text else text
+
+def _nt_value(term):
+    """Plain text of an N-Triples term: IRI without brackets or unescaped literal"""
+    if term.startswith('<'):
+        return _nt_unescape(term[1:-1])
+    if term.startswith('"'):
+        return _nt_unescape(term[1:term.rindex('"')])
+    return term
+
+def read_tsv(path, delimiter='\t'):
+    """Yield (head, relation, tail) from a delimited file, skipping blanks and '#' comments"""
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.rstrip('\n')
+            if not line.strip() or line.startswith('#'):
+                continue
+            fields = line.split(delimiter)
+            if len(fields) != 3:
+                raise ValueError(f"{path}:{line_number}: expected 3 fields, got {len(fields)}")
+            yield fields[0], fields[1], fields[2]
+
+def read_ntriples(path):
+    """Yield (subject, predicate, object) from an N-Triples file"""
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip() or line.lstrip().startswith('#'):
+                continue
+            match = _NT_LINE.match(line)
+            if match is None:
+                raise ValueError(f"{path}:{line_number}: not a valid N-Triples statement")
+            try:
+                yield tuple(_nt_value(term) for term in match.groups())
+            except ValueError as e:
+                raise ValueError(f"{path}:{line_number}: {e}") from None
+
+def read_jsonl(path):
+    """Yield triples from JSON lines holding {"head", "relation", "tail"} objects or 3-item lists"""
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, dict):
+                try:
+                    yield record['head'], record['relation'], record['tail']
+                except KeyError as e:
+                    raise ValueError(f"{path}:{line_number}: missing key {e}") from None
+            elif isinstance(record, list) and len(record) == 3:
+                yield tuple(record)
+            else:
+                raise ValueError(f"{path}:{line_number}: expected a triple object or list")
+
+READERS = {
+    'tsv': read_tsv,
+    'nt': read_ntriples,
+    'jsonl': read_jsonl
+}
+
+EXTENSION_FORMATS = {
+    '.tsv': 'tsv',
+    '.txt': 'tsv',
+    '.nt': 'nt',
+    '.jsonl': 'jsonl',
+    '.ndjson': 'jsonl'
+}
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in EXTENSION_FORMATS:
+        raise ValueError(f"Cannot infer the triple format of {path}, pass it explicitly")
+    return EXTENSION_FORMATS[extension]
+
+def read_triples(path, format=None):
+    """Stream triples from a TSV, N-Triples or JSONL file, inferring the format from the extension"""
+    return READERS[format or detect_format(path)](path)
+
+class Checkpoint:
+    """Progress of a validation run over a triple stream, saved atomically to a JSON file.
+
+    Triples complete out of order, so progress is a watermark below which every
+    position is done, plus the few completed positions above it. The size of
+    the results file at save time is stored too, so a resumed run can truncate
+    results written after the last checkpoint instead of duplicating them.
+    """
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = source
+        self.watermark = 0
+        self.done_above = set()
+        self.output_offset = 0
+
+    @staticmethod
+    def _fingerprint(source):
+        stat = os.stat(source)
+        return {'path': os.path.abspath(source), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    @classmethod
+    def load(cls, path, source):
+        """Load the checkpoint for source, or start a fresh one if none exists"""
+        checkpoint = cls(path, source)
+        if not os.path.exists(path):
+            return checkpoint
+        with open(path, encoding='utf-8') as f:
+            state = json.load(f)
+        if state['source'] != cls._fingerprint(source):
+            raise ValueError(f"Checkpoint {path} was written for a different version of {source}")
+        checkpoint.watermark = state['watermark']
+        checkpoint.done_above = set(state['done_above'])
+        checkpoint.output_offset = state['output_offset']
+        return checkpoint
+
+    def is_done(self, position):
+        return position < self.watermark or position in self.done_above
+
+    def mark_done(self, position):
+        self.done_above.add(position)
+        while self.watermark in self.done_above:
+            self.done_above.remove(self.watermark)
+            self.watermark += 1
+
+    def save(self, output_offset):
+        self.output_offset = output_offset
+        state = {
+            'source': self._fingerprint(self.source),
+            'watermark': self.watermark,
+            'done_above': sorted(self.done_above),
+            'output_offset': output_offset
+        }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
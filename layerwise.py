@@ -0,0 +1,141 @@
+"""Layer-wise GCN inference for graphs whose activations do not fit in memory.
+
+Instead of running every layer over the whole graph at once, each layer is
+computed for one batch of target nodes at a time, reading the previous
+layer's activations from memory-mapped .npy files and writing its own. Every
+batch is exact (no sampling), and peak memory depends on the batch size and
+edge chunk, not on the number of nodes. Batches of a layer are independent,
+so they are spread over worker processes that share the files.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import torch
+from config import GCN_INFERENCE_BATCH_SIZE, GCN_INFERENCE_EDGE_CHUNK, GCN_INFERENCE_WORKERS
+
+def _open(work_dir, name):
+    return np.load(os.path.join(work_dir, name + '.npy'), mmap_mode='r')
+
+def _layer_batch(work_dir, source_path, target_path, start, end, bias, next_weight, edge_chunk):
+    """Compute one layer for target nodes [start, end) and write them to target.
+
+    Messages follow GCNConv: a symmetric-normalized sum over incoming edges
+    plus a self loop, then the bias. Hidden layers store relu(h) already
+    transformed by the next layer's weight, the last layer stores h.
+    """
+    ptr = _open(work_dir, 'ptr')
+    src = _open(work_dir, 'src')
+    dst = _open(work_dir, 'dst')
+    deg_inv_sqrt = _open(work_dir, 'deg_inv_sqrt')
+    inputs = np.load(source_path, mmap_mode='r')
+
+    scale = deg_inv_sqrt[start:end]
+    h = inputs[start:end] * (scale * scale)[:, None]
+    for first in range(ptr[start], ptr[end], edge_chunk):
+        last = min(first + edge_chunk, ptr[end])
+        s, d = src[first:last], dst[first:last]
+        messages = inputs[s] * (deg_inv_sqrt[s] * deg_inv_sqrt[d])[:, None]
+        torch.from_numpy(h).index_add_(0, torch.from_numpy(d - start), torch.from_numpy(messages))
+    h += bias
+    if next_weight is not None:
+        h = np.maximum(h, 0) @ next_weight.T
+
+    outputs = np.load(target_path, mmap_mode='r+')
+    outputs[start:end] = h
+    outputs.flush()
+
+def _input_rows(gcn, x, start, end):
+    """First layer's transformed input for nodes [start, end)"""
+    lin = gcn.convs[0].lin
+    if gcn.node_embedding is not None:
+        return lin(gcn.node_embedding(x[start:end]))
+    if x.is_sparse:
+        # Sparse rows times the weight: never densify a batch of N-wide one-hot rows
+        rows = x.index_select(0, torch.arange(start, end))
+        return torch.sparse.mm(rows, lin.weight.t())
+    return lin(x[start:end])
+
+def layerwise_inference(gcn, graph_context, output_path, work_dir=None,
+                        batch_size=GCN_INFERENCE_BATCH_SIZE, num_workers=GCN_INFERENCE_WORKERS,
+                        edge_chunk=GCN_INFERENCE_EDGE_CHUNK):
+    """Compute gcn's node embeddings into a float32 .npy file at output_path.
+
+    Intermediate layers go to work_dir (defaults to next to output_path) and
+    are removed afterwards. num_workers=0 runs every batch in this process.
+    Workers are spawned, so scripts calling this need an
+    `if __name__ == "__main__"` guard.
+    Returns the output as a read-only memory map.
+    """
+    work_dir = work_dir or output_path + '.work'
+    os.makedirs(work_dir, exist_ok=True)
+    x, edge_index = graph_context['x'], graph_context['edge_index']
+    num_nodes = len(graph_context['node_to_id'])
+    channels = gcn.convs[0].lin.weight.shape[0]
+
+    # Incoming edges grouped by target, self loops dropped and re-added once
+    # per node as GCNConv does
+    src, dst = edge_index
+    keep = src != dst
+    src, dst = src[keep], dst[keep]
+    order = torch.argsort(dst, stable=True)
+    ptr = torch.zeros(num_nodes + 1, dtype=torch.long)
+    ptr[1:] = torch.cumsum(torch.bincount(dst, minlength=num_nodes), dim=0)
+    deg_inv_sqrt = (ptr[1:] - ptr[:-1] + 1).float().pow(-0.5)
+    for name, array in (('src', src[order]), ('dst', dst[order]), ('ptr', ptr),
+                        ('deg_inv_sqrt', deg_inv_sqrt)):
+        np.save(os.path.join(work_dir, name + '.npy'), array.numpy())
+    del src, dst, order, keep
+
+    buffers = [os.path.join(work_dir, 'layer_a.npy'), os.path.join(work_dir, 'layer_b.npy')]
+    for path in buffers:
+        np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(num_nodes, channels)).flush()
+    output = np.lib.format.open_memmap(output_path, mode='w+', dtype=np.float32,
+                                       shape=(num_nodes, channels))
+    output.flush()
+    del output
+
+    gcn.eval()
+    with torch.inference_mode():
+        first = np.load(buffers[0], mmap_mode='r+')
+        for start in range(0, num_nodes, batch_size):
+            end = min(start + batch_size, num_nodes)
+            first[start:end] = _input_rows(gcn, x, start, end).numpy()
+        first.flush()
+        del first
+
+        weights = [
+            (conv.bias.numpy().astype(np.float32), conv.lin.weight.numpy().astype(np.float32))
+            for conv in gcn.convs
+        ]
+
+    # Fresh interpreters: forking a process that already runs torch and thread pools is unsafe
+    executor = (ProcessPoolExecutor(num_workers, mp_context=multiprocessing.get_context('spawn'))
+                if num_workers > 0 else None)
+    try:
+        for i, (bias, _) in enumerate(weights):
+            source = buffers[i % 2]
+            last = i == len(weights) - 1
+            target = output_path if last else buffers[(i + 1) % 2]
+            next_weight = None if last else weights[i + 1][1]
+            tasks = [
+                (work_dir, source, target, start, min(start + batch_size, num_nodes),
+                 bias, next_weight, edge_chunk)
+                for start in range(0, num_nodes, batch_size)
+            ]
+            if executor is None:
+                for task in tasks:
+                    _layer_batch(*task)
+            else:
+                # A layer needs all of the previous one, so wait for every batch
+                for future in [executor.submit(_layer_batch, *task) for task in tasks]:
+                    future.result()
+    finally:
+        if executor is not None:
+            executor.shutdown()
+        for path in buffers + [os.path.join(work_dir, name + '.npy')
+                               for name in ('src', 'dst', 'ptr', 'deg_inv_sqrt')]:
+            os.remove(path)
+        os.rmdir(work_dir)
+
+    return np.load(output_path, mmap_mode='r')
@@ -0,0 +1,128 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from config import LLM_CACHE_ENABLED, LLM_CACHE_PATH, LLM_CACHE_TTL_SECONDS, LLM_CACHE_MAX_ENTRIES
+
+logger = logging.getLogger(__name__)
+
+class ResponseCache:
+    """Disk-backed LLM response cache keyed by provider, model and a hash of the prompt.
+
+    Entries older than ttl_seconds are treated as misses. Once more than
+    max_entries responses are stored, the least recently used ones are evicted.
+    The SQLite file can be shared by several processes.
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, ttl_seconds=LLM_CACHE_TTL_SECONDS,
+                 max_entries=LLM_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                provider TEXT NOT NULL,
+                model TEXT NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)")
+        self._conn.commit()
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    @staticmethod
+    def make_key(provider, model, prompt):
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return f"{provider}:{model}:{digest}"
+
+    def get(self, provider, model, prompt):
+        """Return the cached response, or None on a miss or an expired entry"""
+        key = self.make_key(provider, model, prompt)
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.ttl_seconds is not None and now - row[1] > self.ttl_seconds:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._conn.commit()
+                self._entries -= 1
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, provider, model, prompt, response):
+        key = self.make_key(provider, model, prompt)
+        now = time.time()
+        with self._lock:
+            exists = self._conn.execute("SELECT 1 FROM responses WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?)",
+                (key, provider, model, response, now, now)
+            )
+            if not exists:
+                self._entries += 1
+            if self.max_entries is not None and self._entries > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop least recently used entries so the cache is back within max_entries"""
+        # Count again: other processes may share the file
+        self._entries = self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        excess = self._entries - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM responses WHERE key IN "
+                "(SELECT key FROM responses ORDER BY accessed_at LIMIT ?)",
+                (excess,)
+            )
+            self._entries -= excess
+            logger.info(f"Evicted {excess} cached LLM responses")
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'entries': self._entries}
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+            self._entries = 0
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+_shared_cache = None
+_shared_cache_lock = threading.Lock()
+
+def get_response_cache():
+    """Return the process-wide response cache shared by all agents, or None when disabled"""
+    global _shared_cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = ResponseCache()
+        return _shared_cache
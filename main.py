@@ -1,6 +1,7 @@
-import torch
 import networkx as nx
+from graph_data import convert_graph_to_pytorch_geometric
 from makged import MAKGED
+from results_store import ResultsStore
 
 def create_sample_knowledge_graph():
     # Create a sample knowledge graph
@@ -34,24 +35,6 @@ def create_sample_knowledge_graph():
     
     return G
 
-def convert_graph_to_pytorch_geometric(G):
-    # Convert networkx graph to PyTorch Geometric format
-    num_nodes = len(G.nodes())
-    
-    # Create node features (simple one-hot encoding for demonstration)
-    x = torch.eye(num_nodes)
-    
-    # Create edge index
-    edge_index = []
-    for edge in G.edges():
-        src = list(G.nodes()).index(edge[0])
-        dst = list(G.nodes()).index(edge[1])
-        edge_index.append([src, dst])
-    
-    edge_index = torch.tensor(edge_index).t().contiguous()
-    
-    return {'x': x, 'edge_index': edge_index}
-
 def main():
     # Create sample knowledge graph
     print("Creating sample knowledge graph...")
@@ -62,8 +45,11 @@ def main():
     
     # Initialize MAKGED
     print("\nInitializing MAKGED framework...")
-    makged = MAKGED()
-    makged.initialize_gcn(num_features=len(kg.nodes()))
+    # Results are kept across runs; a second run answers from the store
+    results_store = ResultsStore()
+    makged = MAKGED(results_store=results_store)
+    makged.initialize_gcn(graph_data['num_features'], graph_data['num_embeddings'])
+    makged.warmup(graph_data)
     
     # Test triple to analyze (intentionally incorrect to demonstrate error detection)
     test_triple = ("Huawei Honor 10", "network support", "5G")
@@ -77,8 +63,13 @@ def main():
     print("\nAgent Reasonings:")
     for agent, result in agent_results.items():
         print(f"\n{agent.upper()}:")
+        print(f"Verdict: {result['verdict']}")
         print(f"Confidence: {result['confidence']}")
         print(f"Reasoning: {result['reasoning']}")
+    
+    print("\nError rate by relation:")
+    for relation, judged, errors, rate in results_store.error_rate_by_relation():
+        print(f"{relation}: {errors}/{judged} ({rate:.0%})")
 
 if __name__ == "__main__":
     main()
@@ -1,104 +1,910 @@
-import torch
-from models import GCNEncoder
+import hashlib
+import contextvars
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+from providers import get_provider_registry
+from embedding_store import get_embedding_store
+from discussion import DiscussionHistory
+from tracing import NOOP_TRACER
 from agents import (
     HeadForwardAgent, HeadBackwardAgent,
     TailForwardAgent, TailBackwardAgent,
-    DiscussionFacilitator, SummarizerDecisionMaker
+    DiscussionFacilitator, SummarizerDecisionMaker,
+    parse_verdict
 )
 from config import (
     MAX_DISCUSSION_ROUNDS,
     CONFIDENCE_THRESHOLD,
-    VOTING_THRESHOLD
+    VOTING_THRESHOLD,
+    DISCUSSION_CALL_BUDGET,
+    DISCUSSION_TIME_BUDGET,
+    MAX_CONCURRENT_TRIPLES,
+    EMBEDDING_CACHE_SIZE,
+    SCREENING_THRESHOLD,
+    SCREENING_BATCH_SIZE,
+    PACKED_WINDOW,
+    GCN_WEIGHTS_PATH,
+    EMBEDDING_MODEL,
+    EMBEDDING_PROVIDER,
+    EMBEDDING_BATCH_SIZE
 )
 
+logger = logging.getLogger(__name__)
+
+# Agents that analyze the triple from a directional perspective and vote
+PERSPECTIVE_AGENTS = ('hfa', 'hba', 'tfa', 'tba')
+
+# Superseded graph versions remembered so late results of them are not cached
+RETIRED_VERSIONS_KEPT = 1024
+
+def _vote(votes):
+    """Outcome of the error votes: whether the error share exceeds VOTING_THRESHOLD"""
+    return sum(votes) / len(votes) > VOTING_THRESHOLD
+
+def _decisive_vote(votes):
+    """Outcome of the error votes, or None for a tie: an error share of exactly VOTING_THRESHOLD"""
+    if sum(votes) / len(votes) == VOTING_THRESHOLD:
+        return None
+    return _vote(votes)
+
+def consensus(batch):
+    """Consensus outcome of each agent_results dict in batch, vectorized over the batch.
+
+    A triple has consensus when every agent is above CONFIDENCE_THRESHOLD and
+    all give the same verdict; its outcome is then whether that verdict is
+    'error'. Triples without consensus get None.
+    """
+    if not batch:
+        return []
+    verdicts = np.array([[result['verdict'] for result in results.values()] for results in batch],
+                        dtype=object)
+    confidences = np.array([[result['confidence'] for result in results.values()] for results in batch],
+                           dtype=float)
+    errors = verdicts == 'error'
+    decided = (
+        (confidences > CONFIDENCE_THRESHOLD).all(axis=1)
+        & (errors.all(axis=1) | (verdicts == 'valid').all(axis=1))
+    )
+    return [bool(error) if agreed else None for agreed, error in zip(decided, errors[:, 0])]
+
+def _agents_to_requery(agent_results):
+    """Agents below CONFIDENCE_THRESHOLD or without a verdict, or confident but not in a confident majority.
+
+    When the confident agents are tied, all of them are re-queried.
+    """
+    confident = {
+        name: result['verdict'] == 'error'
+        for name, result in agent_results.items()
+        if result['confidence'] > CONFIDENCE_THRESHOLD and result['verdict'] in ('valid', 'error')
+    }
+    majority = _decisive_vote(list(confident.values())) if confident else None
+    return [
+        name for name in agent_results
+        if name not in confident or confident[name] != majority
+    ]
+
+def _settled_outcome(agent_results, requery):
+    """The vote outcome if no vote of the requery agents can change or tie it, else None"""
+    settled = [
+        result['verdict'] == 'error'
+        for name, result in agent_results.items()
+        if name not in requery
+    ]
+    if not settled:
+        return None
+    extra = len(requery)
+    outcome = _decisive_vote(settled + [True] * extra)
+    return outcome if outcome is not None and outcome == _decisive_vote(settled + [False] * extra) else None
+
+def graph_fingerprint(graph_context):
+    """Identify a graph version for caching.
+    
+    Uses graph_context['version'] when the caller provides one, otherwise a
+    hash of the node features and edge index.
+    """
+    if 'version' in graph_context:
+        return str(graph_context['version'])
+    digest = hashlib.sha1()
+    for key in ('x', 'edge_index', 'edge_type'):
+        tensor = graph_context.get(key)
+        if tensor is None:
+            continue
+        tensor = tensor.detach().cpu()
+        digest.update(f"{key}:{tuple(tensor.shape)}:{tensor.dtype}".encode())
+        if tensor.is_sparse:
+            tensor = tensor.coalesce()
+            digest.update(tensor.indices().numpy().tobytes())
+            tensor = tensor.values()
+        digest.update(tensor.contiguous().numpy().tobytes())
+    return digest.hexdigest()
+
 class MAKGED:
-    def __init__(self):
-        # Initialize agents
+    def __init__(self, max_concurrency=MAX_CONCURRENT_TRIPLES, registry=None, use_cache=True,
+                 tracer=None, cache_results=False, embedding_store=None,
+                 call_budget=DISCUSSION_CALL_BUDGET, time_budget=DISCUSSION_TIME_BUDGET,
+                 results_store=None):
+        # Initialize agents. A custom provider registry lets them run against
+        # other backends, e.g. MockProvider for offline benchmarks.
+        self.registry = registry or get_provider_registry()
         self.agents = {
-            'hfa': HeadForwardAgent(),
-            'hba': HeadBackwardAgent(),
-            'tfa': TailForwardAgent(),
-            'tba': TailBackwardAgent(),
-            'df': DiscussionFacilitator(),
-            'sdm': SummarizerDecisionMaker()
+            'hfa': HeadForwardAgent(self.registry, use_cache),
+            'hba': HeadBackwardAgent(self.registry, use_cache),
+            'tfa': TailForwardAgent(self.registry, use_cache),
+            'tba': TailBackwardAgent(self.registry, use_cache),
+            'df': DiscussionFacilitator(self.registry, use_cache),
+            'sdm': SummarizerDecisionMaker(self.registry, use_cache)
         }
         
         # Initialize GCN model
         self.gcn = None  # Will be initialized when data is loaded
         
-    def initialize_gcn(self, num_features):
-        self.gcn = GCNEncoder(num_features)
+        # Per-stage spans; the no-op tracer keeps the overhead negligible
+        self.tracer = tracer or NOOP_TRACER
+        
+        # Per-triple limits on agent calls and seconds; once a discussion round
+        # would exceed them, the SDM decides right away
+        self.call_budget = call_budget
+        self.time_budget = time_budget
+        
+        # Optional structural pre-screening of triples before the LLM agents
+        self.scorer = None
+        
+        # Full-graph embeddings keyed by graph fingerprint, most recent last
+        self._embedding_cache = OrderedDict()
+        self._embedding_lock = threading.Lock()
+        # Last hashed (x, edge_index, tensor versions) -> fingerprint
+        self._fingerprint_memo = None
+        # Persistent GCN and semantic vectors, shared across runs like the
+        # response cache
+        if embedding_store is None and use_cache:
+            embedding_store = get_embedding_store()
+        self.embedding_store = embedding_store
+        self._weights_version = None
+        
+        # Per-layer activations of the most recently computed graph version,
+        # which update_graph refreshes incrementally
+        self._activations = None
+        # Adjacency index of the most recently seen graph version
+        self._extractor = None
+        
+        # Per-triple results for one line of graph versions. update_graph drops
+        # only those depending on nodes the update touched, found through the
+        # node id -> triples index.
+        self.cache_results = cache_results
+        self._results = {}
+        self._results_version = None
+        self._retired_versions = OrderedDict()
+        self._result_index = {}
+        
+        # Optional ResultsStore: every result is appended to it, and triples
+        # it already holds for the current graph version are not judged again
+        self.results_store = results_store
+        self._results_lock = threading.RLock()
+        
+        # Each agent talks to a different provider, so their calls can overlap.
+        # The pool is sized so every in-flight triple can run all agents at once.
+        self.max_concurrency = max_concurrency
+        self._agent_pool = ThreadPoolExecutor(
+            max_workers=max_concurrency * len(PERSPECTIVE_AGENTS),
+            thread_name_prefix="makged-agent"
+        )
+        
+    def close(self):
+        """Shut down the agent thread pool; the instance cannot detect errors afterwards"""
+        self._agent_pool.shutdown(wait=True)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def warmup(self, graph_context=None):
+        """Create provider clients and model handles for all agents up front.
+        
+        With a graph_context, the neighborhood index is built as well, and the
+        graph embeddings when a screening scorer is trained (only screening
+        reads them), so the first triple pays no setup cost. Returns whether
+        each agent's provider is ready.
+        """
+        futures = {
+            name: self._agent_pool.submit(agent.warmup)
+            for name, agent in self.agents.items()
+        }
+        if graph_context is not None:
+            if self.gcn is not None and self.scorer is not None:
+                self.get_cached_graph_embeddings(graph_context)
+            self.get_neighborhood_extractor(graph_context)
+        return {name: future.result() for name, future in futures.items()}
+        
+    def initialize_gcn(self, num_features, num_embeddings=None, weights_path=GCN_WEIGHTS_PATH):
+        """Create the GCN, with trained weights from weights_path when that file exists"""
+        from models import GCNEncoder
+        if weights_path and os.path.exists(weights_path):
+            gcn = GCNEncoder.load(weights_path)
+            shape = (gcn.convs[0].in_channels,
+                     None if gcn.node_embedding is None else gcn.node_embedding.num_embeddings)
+            if shape != (num_features, num_embeddings):
+                raise ValueError(f"GCN weights in {weights_path} are for (num_features, num_embeddings) "
+                                 f"{shape}, the graph has {(num_features, num_embeddings)}")
+            self.gcn = gcn
+        else:
+            self.gcn = GCNEncoder(num_features, num_embeddings)
+        self.clear_embedding_cache()
+    
+    def save_gcn(self, path):
+        """Save the GCN weights, e.g. after train_screening(train_encoder=True)"""
+        self.gcn.save(path)
+    
+    def load_gcn(self, path):
+        """Replace the GCN with trained weights saved by save_gcn"""
+        from models import GCNEncoder
+        self.gcn = GCNEncoder.load(path)
+        self.clear_embedding_cache()
+    
+    def save_scorer(self, path):
+        """Save the screening scorer trained by train_screening"""
+        self.scorer.save(path)
+    
+    def load_scorer(self, path):
+        """Replace the screening scorer with one saved by save_scorer"""
+        from screening import PlausibilityScorer
+        self.scorer = PlausibilityScorer.load(path)
         
     def get_graph_embeddings(self, x, edge_index):
         """Get graph structure embeddings using GCN"""
-        return self.gcn(x, edge_index)
+        import torch
+        self.gcn.eval()
+        with torch.inference_mode():
+            return self.gcn.embed(x, edge_index)
+    
+    def clear_embedding_cache(self):
+        """Drop cached graph embeddings, e.g. after the GCN weights change"""
+        with self._embedding_lock:
+            self._embedding_cache.clear()
+            self._activations = None
+            self._weights_version = None
+    
+    def _graph_version(self, graph_context):
+        """Fingerprint the graph, hashing the same unmodified tensors only once"""
+        if 'version' in graph_context:
+            return str(graph_context['version'])
+        x, edge_index = graph_context['x'], graph_context['edge_index']
+        key = (x, x._version, edge_index, edge_index._version)
+        memo = self._fingerprint_memo
+        if memo is not None and all(a is b for a, b in zip(memo[0], key)):
+            return memo[1]
+        version = graph_fingerprint(graph_context)
+        self._fingerprint_memo = (key, version)
+        return version
+    
+    def get_cached_graph_embeddings(self, graph_context):
+        """Return GCN embeddings for the whole graph, computed once per graph version and model.
+        
+        With an embedding store, embeddings saved by an earlier run with the
+        same graph and GCN weights are memory-mapped instead of recomputed.
+        """
+        import torch
+        version = self._graph_version(graph_context)
+        with self._embedding_lock:
+            embeddings = self._embedding_cache.get(version)
+            if embeddings is None:
+                embeddings = self._load_stored_embeddings(version)
+            if embeddings is None:
+                self.gcn.eval()
+                with torch.inference_mode():
+                    layers = self.gcn.forward_layers(graph_context['x'], graph_context['edge_index'])
+                embeddings = layers[-1]
+                self._activations = (version, layers)
+                self._save_stored_embeddings(graph_context, version, embeddings)
+            if version not in self._embedding_cache:
+                self._embedding_cache[version] = embeddings
+                while len(self._embedding_cache) > EMBEDDING_CACHE_SIZE:
+                    self._embedding_cache.popitem(last=False)
+            self._embedding_cache.move_to_end(version)
+        return embeddings
+    
+    def compute_embeddings_to_disk(self, graph_context, path, **kwargs):
+        """Compute the graph's embeddings layer by layer into a .npy file and cache them memory-mapped.
+        
+        For graphs whose full-batch activations do not fit in memory; kwargs
+        go to layerwise.layerwise_inference (batch_size, num_workers, ...).
+        Lookups then read rows from the file through the page cache.
+        """
+        import torch
+        from layerwise import layerwise_inference
+        version = self._graph_version(graph_context)
+        with self.tracer.span('layerwise_inference', nodes=len(graph_context['node_to_id'])):
+            layerwise_inference(self.gcn, graph_context, path, **kwargs)
+        # Copy-on-write mapping: zero-copy, and writable as torch expects
+        embeddings = torch.from_numpy(np.load(path, mmap_mode='c'))
+        with self._embedding_lock:
+            self._embedding_cache[version] = embeddings
+            self._embedding_cache.move_to_end(version)
+            while len(self._embedding_cache) > EMBEDDING_CACHE_SIZE:
+                self._embedding_cache.popitem(last=False)
+        return embeddings
+    
+    def _gcn_weights_version(self):
+        """Fingerprint of the GCN weights, so stored embeddings are only reused for the same model"""
+        if self._weights_version is None:
+            # Reduced-precision inference gives different embeddings
+            digest = hashlib.sha1(self.gcn.inference_dtype.encode('utf-8'))
+            for name, tensor in self.gcn.state_dict().items():
+                digest.update(name.encode('utf-8'))
+                digest.update(tensor.detach().contiguous().numpy().tobytes())
+            self._weights_version = digest.hexdigest()
+        return self._weights_version
+    
+    def _load_stored_embeddings(self, version):
+        import torch
+        if self.embedding_store is None:
+            return None
+        table = self.embedding_store.table('gcn')
+        if table is None or table.metadata != {'graph': version, 'weights': self._gcn_weights_version()}:
+            return None
+        return torch.from_numpy(table.vectors)
+    
+    def _save_stored_embeddings(self, graph_context, version, embeddings):
+        if self.embedding_store is None:
+            return
+        node_to_id = graph_context['node_to_id']
+        keys = [None] * len(node_to_id)
+        for node, node_id in node_to_id.items():
+            keys[node_id] = node
+        self.embedding_store.write('gcn', keys, embeddings.numpy(),
+                                   metadata={'graph': version, 'weights': self._gcn_weights_version()})
+    
+    def get_node_embedding(self, graph_context, node):
+        """Look up the GCN embedding row for a node, or None if it is not in the graph"""
+        node_id = graph_context.get('node_to_id', {}).get(node)
+        if node_id is None:
+            return None
+        return self.get_cached_graph_embeddings(graph_context)[node_id].float()
+    
+    def cache_stats(self):
+        """Hit/miss counters of the LLM response cache shared by all agents"""
+        cache = self.agents['hfa'].cache
+        if cache is None:
+            return {'hits': 0, 'misses': 0, 'entries': 0}
+        return cache.stats()
+    
+    def get_neighborhood_extractor(self, graph_context):
+        """Return the neighborhood extractor for this graph version, indexing it on first use"""
+        from subgraph import NeighborhoodExtractor
+        version = self._graph_version(graph_context)
+        cached = self._extractor
+        if cached is None or cached[0] != version:
+            cached = (version, NeighborhoodExtractor(graph_context))
+            self._extractor = cached
+        return cached[1]
+    
+    def update_graph(self, graph_context, added=(), removed=(), version=None):
+        """Apply edge insertions and deletions without recomputing the whole graph.
+        
+        added and removed hold (head, relation, tail) triples; added ones must
+        connect entities already in the graph, removing one drops all its
+        parallel edges. Returns the updated graph context, versioned as
+        version or derived from the previous version and the edit.
+        
+        If the previous version's embeddings are cached, they are refreshed in
+        place for the nodes within GCN_NUM_LAYERS hops of the change. Cached
+        per-triple results whose neighborhoods include an end of an edited
+        edge are dropped, the rest carry over to the new version.
+        """
+        import torch
+        with self.tracer.span('update_graph', added=len(added), removed=len(removed)) as span:
+            node_to_id = graph_context['node_to_id']
+            relations = list(graph_context['relations'])
+            relation_to_id = {relation: i for i, relation in enumerate(relations)}
+            
+            def edge_rows(triples, adding):
+                rows = []
+                for head, relation, tail in triples:
+                    if head not in node_to_id or tail not in node_to_id:
+                        if adding:
+                            raise ValueError(f"Unknown entity in {(head, relation, tail)}, "
+                                             "rebuild the graph context to add entities")
+                        continue
+                    if relation not in relation_to_id:
+                        if not adding:
+                            continue
+                        relation_to_id[relation] = len(relations)
+                        relations.append(relation)
+                    rows.append((node_to_id[head], relation_to_id[relation], node_to_id[tail]))
+                return torch.tensor(rows, dtype=torch.long).reshape(-1, 3)
+            
+            removed_rows = edge_rows(removed, adding=False)
+            added_rows = edge_rows(added, adding=True)
+            old_version = self._graph_version(graph_context)
+            if version is None:
+                digest = hashlib.sha1(old_version.encode('utf-8'))
+                digest.update(removed_rows.numpy().tobytes())
+                digest.update(b'+')
+                digest.update(added_rows.numpy().tobytes())
+                version = digest.hexdigest()
+            
+            # Drop removed edges by matching (head, relation, tail) keys in one pass
+            edge_index, edge_type = graph_context['edge_index'], graph_context['edge_type']
+            num_nodes, num_relations = len(node_to_id), max(len(relations), 1)
+            keys = (edge_index[0] * num_relations + edge_type) * num_nodes + edge_index[1]
+            removed_keys = (removed_rows[:, 0] * num_relations + removed_rows[:, 1]) * num_nodes + removed_rows[:, 2]
+            keep = ~torch.isin(keys, removed_keys)
+            added_edges = added_rows[:, [0, 2]].t()
+            new_context = dict(
+                graph_context,
+                edge_index=torch.cat([edge_index[:, keep], added_edges], dim=1),
+                edge_type=torch.cat([edge_type[keep], added_rows[:, 1]]),
+                relations=relations,
+                version=str(version)
+            )
+            changed_edges = torch.cat([edge_index[:, ~keep], added_edges], dim=1)
+            changed = torch.zeros(num_nodes, dtype=torch.bool)
+            changed[changed_edges[1]] = True
+            
+            with self._embedding_lock:
+                activations = self._activations
+                if activations is not None and activations[0] == old_version:
+                    layers = activations[1]
+                    with torch.inference_mode():
+                        affected = self.gcn.refresh(layers, new_context['edge_index'], changed)
+                    # The old version's embeddings were updated in place
+                    self._embedding_cache.pop(old_version, None)
+                    self._embedding_cache[new_context['version']] = layers[-1]
+                    self._activations = (new_context['version'], layers)
+                    span.set(refreshed_nodes=int(affected.sum()))
+            
+            # Results depend only on neighborhoods, which change around the ends
+            # of an edited edge; every node a neighborhood expands is a dependency
+            touched = torch.unique(changed_edges.flatten()).tolist()
+            invalidated = self._invalidate_results(old_version, new_context['version'], touched)
+            span.set(invalidated_results=invalidated)
+            return new_context
+    
+    def _result_dependencies(self, triple, graph_context):
+        """Ids of the nodes a triple's result depends on: its entities and their neighborhoods"""
+        extractor = self.get_neighborhood_extractor(graph_context)
+        nodes = {triple[0], triple[2]}
+        for name in PERSPECTIVE_AGENTS:
+            position, direction = self.agents[name].perspective
+            entity = triple[0] if position == 'head' else triple[2]
+            for head, _, tail in extractor.neighborhood(entity, direction):
+                nodes.update((head, tail))
+        node_to_id = graph_context['node_to_id']
+        return {node_to_id[node] for node in nodes if node in node_to_id}
+    
+    def cached_result(self, triple, graph_context):
+        """Result of an earlier detect_error on this triple still valid for this graph, or None"""
+        version = self._graph_version(graph_context)
+        with self._results_lock:
+            if version != self._results_version:
+                return None
+            entry = self._results.get(tuple(triple))
+        return entry[0] if entry is not None else None
+    
+    def _store_result(self, triple, graph_context, result):
+        version = self._graph_version(graph_context)
+        dependencies = self._result_dependencies(triple, graph_context)
+        with self._results_lock:
+            if version != self._results_version:
+                if version in self._retired_versions:
+                    # Finished after an update superseded its graph version
+                    return
+                self.clear_results()
+                self._results_version = version
+            self._results[tuple(triple)] = (result, dependencies)
+            for node_id in dependencies:
+                self._result_index.setdefault(node_id, set()).add(tuple(triple))
+    
+    def _invalidate_results(self, old_version, new_version, node_ids):
+        """Drop results depending on node_ids and carry the rest over to new_version"""
+        with self._results_lock:
+            self._retired_versions[old_version] = None
+            if len(self._retired_versions) > RETIRED_VERSIONS_KEPT:
+                self._retired_versions.popitem(last=False)
+            if self._results_version != old_version:
+                return 0
+            invalidated = 0
+            for node_id in node_ids:
+                for triple in self._result_index.pop(node_id, ()):
+                    entry = self._results.pop(triple, None)
+                    if entry is None:
+                        continue
+                    invalidated += 1
+                    for other in entry[1]:
+                        dependents = self._result_index.get(other)
+                        if dependents is not None:
+                            dependents.discard(triple)
+            self._results_version = new_version
+            return invalidated
+    
+    def clear_results(self):
+        """Drop all cached per-triple results"""
+        with self._results_lock:
+            self._results.clear()
+            self._result_index.clear()
     
     def get_semantic_embeddings(self, triple):
         """Get semantic embeddings for the triple using OpenAI's embedding model"""
-        # Implementation details omitted for brevity
-        return torch.randn(768)  # Placeholder
-        
-    def detect_error(self, triple, graph_context):
-        """Main error detection process"""
-        print(f"\nAnalyzing triple: {triple}")
-        
-        # Get embeddings
-        graph_emb = self.get_graph_embeddings(graph_context['x'], graph_context['edge_index'])
-        semantic_emb = self.get_semantic_embeddings(triple)
-        
-        # Combined context
-        context = {
-            'graph_embedding': graph_emb,
-            'semantic_embedding': semantic_emb,
-            'graph_context': graph_context
-        }
+        return self.embed_triples([triple])[0]
+    
+    def _stores_semantic_embeddings(self):
+        return self.embedding_store is not None and self.registry.get(EMBEDDING_PROVIDER).cacheable
+    
+    def embed_triples(self, triples):
+        """Semantic embeddings of many triples, None where they could not be fetched.
+        
+        Vectors already in the embedding store are read from it. The rest are
+        fetched with EMBEDDING_MODEL, EMBEDDING_BATCH_SIZE texts per request,
+        and added to the store.
+        """
+        import torch
+        table_name = f"semantic-{EMBEDDING_MODEL}"
+        keys = [json.dumps(list(triple)) for triple in triples]
+        table = self.embedding_store.table(table_name) if self.embedding_store is not None else None
+        vectors = {}
+        missing = {}
+        for key, triple in zip(keys, triples):
+            if table is not None and key in table:
+                vectors[key] = torch.from_numpy(table.get(key))
+            else:
+                missing[key] = triple
         
-        # Initial analysis by all agents
+        missing = list(missing.items())
+        for start in range(0, len(missing), EMBEDDING_BATCH_SIZE):
+            batch = missing[start:start + EMBEDDING_BATCH_SIZE]
+            texts = [f"{head} {relation} {tail}" for _, (head, relation, tail) in batch]
+            try:
+                fetched = self.registry.embed(EMBEDDING_PROVIDER, EMBEDDING_MODEL, texts)
+            except Exception as e:
+                logger.warning(f"Semantic embeddings unavailable: {e}")
+                break
+            fetched = np.asarray(fetched, dtype=np.float32)
+            if self._stores_semantic_embeddings():
+                self.embedding_store.append(table_name, [key for key, _ in batch], fetched)
+            for (key, _), vector in zip(batch, fetched):
+                vectors[key] = torch.from_numpy(vector)
+        return [vectors.get(key) for key in keys]
+    
+    def _traced(self, stage, name, call, *args):
+        with self.tracer.span(stage, agent=name):
+            return call(*args)
+    
+    def _run_perspective_agents(self, call, stage, names=PERSPECTIVE_AGENTS):
+        """Run call(agent) concurrently for the named perspective agents, each in its own span"""
+        futures = {
+            # Copy the context so agent spans nest under the caller's span
+            name: self._agent_pool.submit(
+                contextvars.copy_context().run, self._traced, stage, name, call, self.agents[name]
+            )
+            for name in names
+        }
         agent_results = {}
-        for name, agent in self.agents.items():
-            if name not in ['df', 'sdm']:
-                confidence, reasoning = agent.analyze_triple(triple, context)
-                agent_results[name] = {
-                    'confidence': confidence,
-                    'reasoning': reasoning
-                }
+        for name, future in futures.items():
+            verdict, confidence, reasoning = future.result()
+            agent_results[name] = {
+                'verdict': verdict,
+                'confidence': confidence,
+                'reasoning': reasoning
+            }
+        return agent_results
+        
+    def detect_error(self, triple, graph_context, initial_results=None):
+        """Main error detection process.
+        
+        initial_results, as returned by analyze_packed, replaces the initial
+        analysis by the perspective agents. With cache_results, the result is
+        kept until a graph update touches the nodes it depends on. With a
+        results_store, a decided result from an earlier run is returned as is.
+        """
+        if self.cache_results:
+            result = self.cached_result(triple, graph_context)
+            if result is not None:
+                return result
+        if self.results_store is not None:
+            result = self.results_store.lookup(triple, self._graph_version(graph_context))
+            if result is not None:
+                return result
+        start = time.perf_counter()
+        with self.tracer.span('detect_error', triple=str(triple)) as span:
+            result, rounds = self._detect_error(triple, graph_context, span, initial_results)
+            span.set(is_error=str(result[0]))
+        self._keep_result(triple, graph_context, result, rounds, time.perf_counter() - start)
+        return result
+    
+    def _keep_result(self, triple, graph_context, result, rounds, latency):
+        """Keep a fresh result in the result cache and the results store, where enabled"""
+        if self.cache_results:
+            self._store_result(triple, graph_context, result)
+        if self.results_store is not None:
+            self.results_store.record(triple, self._graph_version(graph_context), result, rounds, latency)
+    
+    def _detect_error(self, triple, graph_context, span, initial_results=None):
+        """Run detection for one triple; returns the result and the number of discussion rounds"""
+        logger.debug(f"Analyzing triple: {triple}")
+        
+        # Each agent gets only the directional neighborhood it reviews, rendered
+        # as compact triples. Embeddings are left out: no prompt uses them, and
+        # a semantic embedding would cost a provider call per triple.
+        with self.tracer.span('context'):
+            extractor = self.get_neighborhood_extractor(graph_context)
+            neighborhoods = {
+                name: extractor.describe(triple, self.agents[name].perspective) for name in PERSPECTIVE_AGENTS
+            }
+        
+        # Initial analysis by all agents, unless already done in a packed request
+        start = time.perf_counter()
+        calls = 0
+        if initial_results is not None:
+            agent_results = initial_results
+        else:
+            agent_results = self._run_perspective_agents(
+                lambda agent: agent.analyze_triple(
+                    triple, {'neighborhood': neighborhoods[agent.role]}
+                ),
+                'analyze'
+            )
+            calls += len(agent_results)
         
         # Check for immediate consensus
-        confidences = [result['confidence'] for result in agent_results.values()]
-        if all(conf > CONFIDENCE_THRESHOLD for conf in confidences):
-            votes = [conf > VOTING_THRESHOLD for conf in confidences]
-            is_error = sum(votes) / len(votes) > VOTING_THRESHOLD
-            return is_error, "Immediate consensus reached", agent_results
+        is_error = consensus([agent_results])[0]
+        if is_error is not None:
+            span.set(rounds=0)
+            return (is_error, "Immediate consensus reached", agent_results), 0
         
         # Initialize discussion
-        discussion_history = []
-        for round in range(MAX_DISCUSSION_ROUNDS):
-            print(f"\nDiscussion Round {round + 1}")
+        discussion_history = DiscussionHistory()
+        round = 0
+        while round < MAX_DISCUSSION_ROUNDS:
+            requery = _agents_to_requery(agent_results)
+            is_error = _settled_outcome(agent_results, requery)
+            if is_error is not None:
+                # However the re-queried agents vote, the majority stays the same
+                span.set(rounds=round, early_exit='settled')
+                return (is_error, f"Vote settled after {round} rounds", agent_results), round
+            if self._over_budget(start, calls + 1 + len(requery)):
+                span.set(early_exit='budget')
+                break
             
-            # Facilitate discussion
-            discussion_points = self.agents['df'].facilitate_discussion(agent_results)
-            discussion_history.append({
-                'round': round + 1,
-                'points': discussion_points,
-                'agent_results': agent_results.copy()
-            })
+            round += 1
+            logger.debug(f"Discussion round {round} for {triple}")
+            span.set(rounds=round)
             
-            # Agents participate in discussion and potentially update their stance
-            for name, agent in self.agents.items():
-                if name not in ['df', 'sdm']:
-                    confidence, reasoning = agent.participate_in_discussion(discussion_points)
-                    agent_results[name] = {
-                        'confidence': confidence,
-                        'reasoning': reasoning
-                    }
+            with self.tracer.span('discussion_round', round=round, requeried=len(requery)):
+                # Facilitate discussion of the agents that are still unsure or
+                # disagree; the settled ones only contribute their confidence
+                focus = {
+                    name: result if name in requery
+                    else {'verdict': result['verdict'], 'confidence': result['confidence']}
+                    for name, result in agent_results.items()
+                }
+                with self.tracer.span('facilitate', agent='df'):
+                    discussion_points = self.agents['df'].facilitate_discussion(triple, focus)
+                if discussion_points is None:
+                    # Without discussion points the agents have nothing new to answer
+                    span.set(early_exit='facilitation')
+                    break
+                discussion_history.add_round(round, discussion_points, agent_results)
+                
+                # Re-queried agents participate in discussion and potentially update their stance
+                agent_results = dict(agent_results, **self._run_perspective_agents(
+                    lambda agent: agent.participate_in_discussion(
+                        triple, {'neighborhood': neighborhoods[agent.role]}, discussion_points
+                    ),
+                    'discuss',
+                    requery
+                ))
+                calls += 1 + len(requery)
             
             # Check for consensus after discussion
-            confidences = [result['confidence'] for result in agent_results.values()]
-            if all(conf > CONFIDENCE_THRESHOLD for conf in confidences):
-                votes = [conf > VOTING_THRESHOLD for conf in confidences]
-                is_error = sum(votes) / len(votes) > VOTING_THRESHOLD
-                return is_error, f"Consensus reached after {round + 1} rounds", agent_results
+            is_error = consensus([agent_results])[0]
+            if is_error is not None:
+                return (is_error, f"Consensus reached after {round} rounds", agent_results), round
         
         # If no consensus reached, let SDM make final decision
-        final_decision = self.agents['sdm'].make_decision(discussion_history)
-        return None, "No consensus - SDM decision: " + final_decision, agent_results
+        if not discussion_history:
+            discussion_history.add_round(0, None, agent_results)
+        with self.tracer.span('decide', agent='sdm'):
+            neighborhood = extractor.describe_all(
+                triple, [self.agents[name].perspective for name in PERSPECTIVE_AGENTS]
+            )
+            final_decision = self.agents['sdm'].make_decision(triple, neighborhood, discussion_history)
+        verdict = parse_verdict(final_decision)
+        is_error = None if verdict is None else verdict[0] == 'error'
+        return (is_error, "No consensus - SDM decision: " + final_decision, agent_results), round
+    
+    def _over_budget(self, start, calls):
+        """Whether a triple that would reach calls agent calls exceeds its call or time budget"""
+        if self.call_budget is not None and calls + 1 > self.call_budget:
+            # The SDM decision needs one more call
+            return True
+        return self.time_budget is not None and time.perf_counter() - start > self.time_budget
+
+    def analyze_packed(self, triples, graph_context):
+        """Initial analysis of many triples with packed requests.
+        
+        Each perspective agent gets one request per group of triples sharing
+        the entity it looks at, split further when a group would not fit its
+        model's context window. Returns one agent_results dict per triple, in
+        the shape produced by the per-triple analysis.
+        """
+        triples = [tuple(triple) for triple in triples]
+        extractor = self.get_neighborhood_extractor(graph_context)
+        results = [{} for _ in triples]
+        futures = {}
+        with self.tracer.span('analyze_packed', triples=len(triples)) as span:
+            for name in PERSPECTIVE_AGENTS:
+                agent = self.agents[name]
+                entity_index = 0 if agent.perspective[0] == 'head' else 2
+                groups = {}
+                for i, triple in enumerate(triples):
+                    groups.setdefault(triple[entity_index], []).append(i)
+                for indices in groups.values():
+                    group = [triples[i] for i in indices]
+                    neighborhood = extractor.describe_group(group, agent.perspective)
+                    size = agent.packed_group_size(neighborhood)
+                    for start in range(0, len(indices), size):
+                        chunk = indices[start:start + size]
+                        future = self._agent_pool.submit(
+                            contextvars.copy_context().run, self._traced, 'analyze', name,
+                            agent.analyze_triples, [triples[i] for i in chunk], neighborhood
+                        )
+                        futures[future] = (name, chunk)
+            span.set(requests=len(futures))
+            for future, (name, chunk) in futures.items():
+                for i, (verdict, confidence, reasoning) in zip(chunk, future.result()):
+                    results[i][name] = {'verdict': verdict, 'confidence': confidence, 'reasoning': reasoning}
+        # Keep the agent order of the per-triple analysis
+        return [{name: result[name] for name in PERSPECTIVE_AGENTS} for result in results]
+    
+    def _pack(self, work, graph_context):
+        """Attach packed initial results to windows of work items that still need the agents.
+        
+        Triples whose packed results already reach consensus are resolved
+        here for the whole window at once, without a detect_error call.
+        """
+        work = iter(work)
+        while True:
+            window = list(itertools.islice(work, PACKED_WINDOW))
+            if not window:
+                return
+            unresolved = [item for item in window if item[2] is None]
+            start = time.perf_counter()
+            initial = self.analyze_packed([triple for _, triple, _ in unresolved], graph_context)
+            latency = time.perf_counter() - start
+            outcomes = iter(zip(initial, consensus(initial)))
+            for key, triple, ready in window:
+                if ready is not None:
+                    yield key, triple, ready, None
+                    continue
+                agent_results, is_error = next(outcomes)
+                if is_error is None:
+                    yield key, triple, None, agent_results
+                    continue
+                result = (is_error, "Immediate consensus reached", agent_results)
+                self._keep_result(triple, graph_context, result, 0, latency)
+                yield key, triple, result, None
+    
+    def train_screening(self, graph_context, epochs=50, train_encoder=False, **kwargs):
+        """Train the structural plausibility scorer offline on the graph's own edges"""
+        from screening import PlausibilityScorer, train_plausibility_scorer
+        if self.scorer is None:
+            self.scorer = PlausibilityScorer(len(graph_context['relations']))
+        train_plausibility_scorer(self.scorer, self.gcn, graph_context, epochs=epochs,
+                                  train_encoder=train_encoder, **kwargs)
+        if train_encoder:
+            self.clear_embedding_cache()
+        return self.scorer
+    
+    def score_triples(self, triples, graph_context):
+        """Structural plausibility of a batch of triples in [0, 1].
+        
+        Triples whose entities or relation are unknown to the graph score 0.
+        """
+        import torch
+        node_to_id = graph_context['node_to_id']
+        relation_to_id = {relation: i for i, relation in enumerate(graph_context['relations'])}
+        ids = [
+            (node_to_id.get(head), relation_to_id.get(relation), node_to_id.get(tail))
+            for head, relation, tail in triples
+        ]
+        known = torch.tensor([None not in row for row in ids], dtype=torch.bool)
+        scores = torch.zeros(len(ids))
+        if known.any():
+            rows = torch.tensor([row for row in ids if None not in row], dtype=torch.long)
+            embeddings = self.get_cached_graph_embeddings(graph_context)
+            with torch.inference_mode():
+                scores[known] = self.scorer.score(embeddings[rows[:, 0]], rows[:, 1], embeddings[rows[:, 2]])
+        return scores
+    
+    def _screen(self, items, graph_context, threshold):
+        """Yield (key, triple, result) with a ready result for plausible triples and None for suspicious ones"""
+        items = iter(items)
+        while True:
+            batch = list(itertools.islice(items, SCREENING_BATCH_SIZE))
+            if not batch:
+                return
+            scores = self.score_triples([triple for _, triple in batch], graph_context).tolist()
+            for (key, triple), score in zip(batch, scores):
+                if score >= threshold:
+                    yield key, triple, (False, f"Passed structural screening (plausibility {score:.2f})", {})
+                else:
+                    yield key, triple, None
+    
+    def detect_errors(self, triples, graph_context, max_concurrency=None, screen=False,
+                      screening_threshold=SCREENING_THRESHOLD, with_keys=False, packed=False):
+        """Detect errors in many triples, yielding (triple, result) as each finishes.
+        
+        Triples are pulled lazily from the iterable so that at most
+        max_concurrency of them are in flight at once; it can lower, but not
+        exceed, the limit the agent pool was sized for in the constructor
+        (ValueError). Results are yielded in
+        completion order, not input order. With screen=True, triples are first
+        scored in batches by the trained plausibility scorer and only those
+        below screening_threshold are escalated to the agents.
+        
+        With with_keys=True the iterable holds (key, triple) pairs and
+        (key, triple, result) is yielded, e.g. to track positions in a stream.
+        
+        With packed=True, windows of PACKED_WINDOW triples get their initial
+        analysis through analyze_packed, so triples sharing an entity cost
+        one request per agent; discussion rounds still run per triple.
+        """
+        if screen and self.scorer is None:
+            raise ValueError("Screening requires a trained scorer, call train_screening first")
+        if max_concurrency is not None and max_concurrency > self.max_concurrency:
+            raise ValueError(f"max_concurrency {max_concurrency} exceeds the {self.max_concurrency} "
+                             "triples the agent pool is sized for, pass it to MAKGED() instead")
+        limit = max_concurrency or self.max_concurrency
+        items = triples if with_keys else ((None, triple) for triple in triples)
+        if screen:
+            work = self._screen(items, graph_context, screening_threshold)
+        else:
+            work = ((key, triple, None) for key, triple in items)
+        if self.cache_results:
+            work = (
+                (key, triple, ready if ready is not None else self.cached_result(triple, graph_context))
+                for key, triple, ready in work
+            )
+        if self.results_store is not None:
+            # Judged in an earlier run: never sent to the agents or packed
+            version = self._graph_version(graph_context)
+            work = (
+                (key, triple, ready if ready is not None else self.results_store.lookup(triple, version))
+                for key, triple, ready in work
+            )
+        if packed:
+            work = self._pack(work, graph_context)
+        else:
+            work = ((key, triple, ready, None) for key, triple, ready in work)
+        
+        def output(key, triple, result):
+            return (key, triple, result) if with_keys else (triple, result)
+        
+        with ThreadPoolExecutor(max_workers=limit, thread_name_prefix="makged-triple") as pool:
+            pending = {}
+            exhausted = False
+            while True:
+                while not exhausted and len(pending) < limit:
+                    item = next(work, None)
+                    if item is None:
+                        exhausted = True
+                    elif item[2] is not None:
+                        yield output(*item[:3])
+                    else:
+                        key, triple, _, initial_results = item
+                        future = pool.submit(self.detect_error, triple, graph_context, initial_results)
+                        pending[future] = (key, triple)
+                if not pending:
+                    return
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    key, triple = pending.pop(future)
+                    yield output(key, triple, future.result())
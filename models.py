@@ -1,11 +1,59 @@
+import logging
 import torch
 import torch.nn.functional as F
 from torch_geometric.nn import GCNConv
-from config import GCN_HIDDEN_CHANNELS, GCN_NUM_LAYERS
+from torch_geometric.utils import add_remaining_self_loops
+from config import GCN_HIDDEN_CHANNELS, GCN_NUM_LAYERS, GCN_INFERENCE_DTYPE, GCN_COMPILE
+
+logger = logging.getLogger(__name__)
+
+INFERENCE_DTYPES = ('float32', 'bfloat16', 'int8')
+
+def gcn_normalize(edge_index, num_nodes):
+    """Edges with self loops and the symmetric normalization GCNConv applies to them"""
+    edge_index, _ = add_remaining_self_loops(edge_index, num_nodes=num_nodes)
+    src, dst = edge_index
+    deg_inv_sqrt = torch.bincount(dst, minlength=num_nodes).float().pow(-0.5)
+    deg_inv_sqrt[torch.isinf(deg_inv_sqrt)] = 0
+    return edge_index, deg_inv_sqrt[src] * deg_inv_sqrt[dst]
+
+def gcn_adjacency(edge_index, num_nodes):
+    """The normalized adjacency GCNConv propagates with, as a CSR matrix of (target, source)"""
+    edge_index, weight = gcn_normalize(edge_index, num_nodes)
+    src, dst = edge_index
+    order = torch.argsort(dst * num_nodes + src)
+    crow = torch.zeros(num_nodes + 1, dtype=torch.long)
+    crow[1:] = torch.cumsum(torch.bincount(dst, minlength=num_nodes), dim=0)
+    return torch.sparse_csr_tensor(crow, src[order], weight[order], size=(num_nodes, num_nodes),
+                                   check_invariants=False)
+
+def affected_nodes(edge_index, changed, num_layers):
+    """Masks of nodes whose layer 1..num_layers activations may differ after an edge change.
+
+    changed marks the targets of inserted or deleted edges. Their degree, and
+    so the normalization of their outgoing edges, changes too, hence layer 1
+    covers their successors as well. Each further layer adds the successors
+    of the previous one.
+    """
+    src, dst = edge_index
+    affected = changed.clone()
+    affected[dst[changed[src]]] = True
+    masks = [affected]
+    for _ in range(num_layers - 1):
+        affected = affected.clone()
+        affected[dst[masks[-1][src]]] = True
+        masks.append(affected)
+    return masks
 
 class GCNEncoder(torch.nn.Module):
-    def __init__(self, num_features):
+    def __init__(self, num_features, num_embeddings=None):
         super().__init__()
+        # With num_embeddings set, x holds node IDs and each node gets a learned
+        # num_features-dimensional input vector instead of a feature row
+        self.node_embedding = None
+        if num_embeddings is not None:
+            self.node_embedding = torch.nn.Embedding(num_embeddings, num_features)
+        
         self.convs = torch.nn.ModuleList()
         self.convs.append(GCNConv(num_features, GCN_HIDDEN_CHANNELS))
         
@@ -13,12 +61,170 @@ class GCNEncoder(torch.nn.Module):
             self.convs.append(GCNConv(GCN_HIDDEN_CHANNELS, GCN_HIDDEN_CHANNELS))
         
         self.convs.append(GCNConv(GCN_HIDDEN_CHANNELS, GCN_HIDDEN_CHANNELS))
+        
+        # Inference path, see prepare_inference. Plain attributes, so they
+        # never end up in the state dict.
+        self.inference_dtype = GCN_INFERENCE_DTYPE
+        self.compile = GCN_COMPILE
+        self._linears = None
+        self._compiled = None
+        # (edge_index, its version, number of nodes, CSR adjacency) of the last graph
+        self._adjacency = None
+
+    def train(self, mode=True):
+        # The weights are about to change: prepared copies go stale
+        if mode:
+            self._linears = None
+            self._compiled = None
+        return super().train(mode)
+
+    def prepare_inference(self, dtype=None, compile=None):
+        """Choose the precision and compilation of the inference path.
+
+        dtype 'bfloat16' runs the dense transforms in bfloat16 and 'int8'
+        with dynamically quantized int8 weights; propagation stays float32.
+        compile runs the layers through torch.compile, falling back to eager
+        if it fails. Copies of the weights are made on first use and again
+        after training.
+        """
+        dtype = dtype or self.inference_dtype
+        if dtype not in INFERENCE_DTYPES:
+            raise ValueError(f"Unknown inference dtype {dtype!r}, expected one of {INFERENCE_DTYPES}")
+        self.inference_dtype = dtype
+        self.compile = self.compile if compile is None else compile
+        self._linears = None
+        self._compiled = None
+
+    def _inference_linears(self):
+        if self._linears is None:
+            linears = []
+            for conv in self.convs:
+                linear = torch.nn.Linear(conv.lin.in_channels, conv.lin.out_channels, bias=False)
+                linear.weight.data.copy_(conv.lin.weight.detach())
+                linear.requires_grad_(False)
+                if self.inference_dtype == 'bfloat16':
+                    linear = linear.to(torch.bfloat16)
+                elif self.inference_dtype == 'int8':
+                    # quantize_dynamic swaps child modules, hence the wrapper
+                    linear = torch.ao.quantization.quantize_dynamic(
+                        torch.nn.Sequential(linear), {torch.nn.Linear}, dtype=torch.qint8
+                    )
+                linears.append(linear)
+            self._linears = linears
+        return self._linears
+
+    def _transform(self, i, x):
+        """Dense transform of layer i; the inference copies are used once the model is in eval mode"""
+        if self.training or x.is_sparse or self.inference_dtype == 'float32':
+            return self.convs[i].lin(x)
+        linear = self._inference_linears()[i]
+        if self.inference_dtype == 'bfloat16':
+            return linear(x.to(torch.bfloat16)).float()
+        return linear(x)
+
+    def adjacency(self, edge_index, num_nodes):
+        """gcn_adjacency of edge_index, cached for the most recent graph"""
+        cached = self._adjacency
+        if (cached is None or cached[0] is not edge_index or cached[1] != edge_index._version
+                or cached[2] != num_nodes):
+            cached = (edge_index, edge_index._version, num_nodes, gcn_adjacency(edge_index, num_nodes))
+            self._adjacency = cached
+        return cached[3]
 
     def forward(self, x, edge_index):
+        if self.node_embedding is not None:
+            x = self.node_embedding(x)
+        
         for conv in self.convs[:-1]:
             x = conv(x, edge_index)
             x = F.relu(x)
-            x = F.dropout(x, p=0.2, training=self.training)
+            if self.training:
+                x = F.dropout(x, p=0.2)
         
         x = self.convs[-1](x, edge_index)
         return x
+
+    def _layers(self, x, adjacency):
+        layers = []
+        for i, conv in enumerate(self.convs):
+            h = self._transform(i, x)
+            layers.append(h)
+            x = torch.sparse.mm(adjacency, h) + conv.bias
+            if i < len(self.convs) - 1:
+                x = F.relu(x)
+        layers.append(x)
+        return layers
+
+    def forward_layers(self, x, edge_index):
+        """Inference pass keeping what refresh needs: each conv's transformed input, then the output.
+
+        Propagation multiplies by the cached CSR adjacency instead of
+        normalizing and scattering over the edges on every call.
+        """
+        if self.node_embedding is not None:
+            x = self.node_embedding(x)
+        adjacency = self.adjacency(edge_index, x.size(0))
+        if not self.compile:
+            return self._layers(x, adjacency)
+        if self._compiled is None:
+            self._compiled = torch.compile(self._layers, dynamic=True)
+        try:
+            return self._compiled(x, adjacency)
+        except Exception as e:
+            logger.warning(f"torch.compile failed, running the GCN eagerly: {e}")
+            self.compile = False
+            return self._layers(x, adjacency)
+
+    def embed(self, x, edge_index):
+        """Output embeddings through the inference path"""
+        return self.forward_layers(x, edge_index)[-1]
+
+    def save(self, path):
+        """Save the trained weights with the shape needed to rebuild the model"""
+        torch.save({
+            'num_features': self.convs[0].in_channels,
+            'num_embeddings': None if self.node_embedding is None else self.node_embedding.num_embeddings,
+            'hidden_channels': GCN_HIDDEN_CHANNELS,
+            'num_layers': len(self.convs),
+            'state_dict': self.state_dict()
+        }, path)
+
+    @classmethod
+    def load(cls, path):
+        """Rebuild a model saved with save, in eval mode"""
+        checkpoint = torch.load(path, map_location='cpu', weights_only=True)
+        if (checkpoint['hidden_channels'], checkpoint['num_layers']) != (GCN_HIDDEN_CHANNELS, GCN_NUM_LAYERS):
+            raise ValueError(
+                f"{path} holds a GCN with {checkpoint['num_layers']} layers of {checkpoint['hidden_channels']} "
+                f"channels, config has {GCN_NUM_LAYERS} of {GCN_HIDDEN_CHANNELS}"
+            )
+        model = cls(checkpoint['num_features'], checkpoint['num_embeddings'])
+        model.load_state_dict(checkpoint['state_dict'])
+        model.eval()
+        return model
+
+    def refresh(self, layers, edge_index, changed):
+        """Update forward_layers output in place after edges into changed nodes were edited.
+
+        edge_index is the graph after the edit. Only nodes within
+        GCN_NUM_LAYERS hops downstream of the change are recomputed, from the
+        stored activations of their predecessors. Returns the mask of nodes
+        whose output embedding was recomputed.
+        """
+        num_nodes = layers[0].size(0)
+        edge_index, weight = gcn_normalize(edge_index, num_nodes)
+        src, dst = edge_index
+        masks = affected_nodes(edge_index, changed, len(self.convs))
+        local = torch.empty(num_nodes, dtype=torch.long)
+        for i, (conv, affected) in enumerate(zip(self.convs, masks)):
+            nodes = affected.nonzero().squeeze(1)
+            local[nodes] = torch.arange(len(nodes))
+            incoming = affected[dst]
+            messages = layers[i][src[incoming]] * weight[incoming].unsqueeze(1)
+            x = torch.zeros(len(nodes), messages.size(1)).index_add_(0, local[dst[incoming]], messages)
+            x = x + conv.bias
+            if i < len(self.convs) - 1:
+                layers[i + 1][nodes] = self._transform(i + 1, F.relu(x))
+            else:
+                layers[-1][nodes] = x
+        return masks[-1]
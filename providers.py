@@ -0,0 +1,447 @@
+import hashlib
+import json
+import logging
+import math
+import random
+import re
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import NamedTuple
+from config import (
+    OPENAI_API_KEY,
+    ANTHROPIC_API_KEY,
+    COHERE_API_KEY,
+    GOOGLE_CLOUD_PROJECT,
+    PROVIDER_RATE_LIMITS,
+    PROVIDER_MAX_RETRIES,
+    PROVIDER_RETRY_BASE_DELAY,
+    PROVIDER_RETRY_MAX_DELAY
+)
+from tracing import current_span
+
+logger = logging.getLogger(__name__)
+
+# HTTP status codes worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+class Completion(NamedTuple):
+    """Text of a model response with the token usage reported by the provider"""
+    text: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+
+class LLMProvider(ABC):
+    """Backend that sends prompts to one LLM service.
+
+    The client is created lazily on first use and shared by every agent that
+    uses the provider. Subclasses import their SDK in create_client, so only
+    the SDKs of providers actually used need to be installed. Subclasses
+    implement create_client and complete, and load_model for services that
+    need a model handle loaded before use.
+    """
+
+    # Whether responses may be stored in the persistent response cache
+    cacheable = True
+
+    def __init__(self):
+        self._client = None
+        self._client_ready = False
+        self._models = {}
+        self._lock = threading.Lock()
+
+    @abstractmethod
+    def create_client(self):
+        pass
+
+    def load_model(self, client, model):
+        """Return the object requests for a model go through; the client by default"""
+        return client
+
+    @abstractmethod
+    def complete(self, handle, model, prompt, max_tokens):
+        """Send a prompt and return a Completion"""
+        pass
+
+    def embed(self, handle, model, texts):
+        """Return one embedding vector per text, for services with embedding models"""
+        raise NotImplementedError(f"{type(self).__name__} does not serve embeddings")
+
+    @property
+    def client(self):
+        """Shared client, or None if it cannot be created"""
+        with self._lock:
+            if not self._client_ready:
+                try:
+                    self._client = self.create_client()
+                except Exception as e:
+                    logger.error(f"Failed to initialize {type(self).__name__} client: {e}")
+                    self._client = None
+                self._client_ready = True
+            return self._client
+
+    def model_handle(self, model):
+        """Handle for a model, loaded once on first use"""
+        handle = self._models.get(model)
+        if handle is not None:
+            return handle
+        client = self.client
+        if client is None:
+            return None
+        with self._lock:
+            # Failures are not remembered so a transient error is retried on the next call
+            if model not in self._models:
+                self._models[model] = self.load_model(client, model)
+            return self._models[model]
+
+class OpenAIProvider(LLMProvider):
+    def create_client(self):
+        # Retries are handled by the registry so they respect the shared rate limits
+        import openai
+        return openai.OpenAI(api_key=OPENAI_API_KEY, max_retries=0)
+
+    def complete(self, handle, model, prompt, max_tokens):
+        response = handle.chat.completions.create(
+            model=model,
+            messages=[{"role": "user", "content": prompt}]
+        )
+        usage = response.usage
+        return Completion(
+            response.choices[0].message.content,
+            getattr(usage, 'prompt_tokens', 0),
+            getattr(usage, 'completion_tokens', 0)
+        )
+
+    def embed(self, handle, model, texts):
+        response = handle.embeddings.create(model=model, input=texts)
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+class AnthropicProvider(LLMProvider):
+    def create_client(self):
+        import anthropic
+        return anthropic.Client(api_key=ANTHROPIC_API_KEY, max_retries=0)
+
+    def complete(self, handle, model, prompt, max_tokens):
+        response = handle.messages.create(
+            model=model,
+            max_tokens=max_tokens,
+            messages=[{"role": "user", "content": prompt}]
+        )
+        usage = response.usage
+        return Completion(
+            response.content[0].text,
+            getattr(usage, 'input_tokens', 0),
+            getattr(usage, 'output_tokens', 0)
+        )
+
+class CohereProvider(LLMProvider):
+    def create_client(self):
+        import cohere
+        return cohere.Client(COHERE_API_KEY)
+
+    def complete(self, handle, model, prompt, max_tokens):
+        response = handle.chat(
+            message=prompt,
+            model=model
+        )
+        units = getattr(getattr(response, 'meta', None), 'billed_units', None)
+        return Completion(
+            response.text,
+            int(getattr(units, 'input_tokens', 0) or 0),
+            int(getattr(units, 'output_tokens', 0) or 0)
+        )
+
+class VertexProvider(LLMProvider):
+    def create_client(self):
+        import google.cloud.aiplatform as aiplatform
+        aiplatform.init(project=GOOGLE_CLOUD_PROJECT)
+        return aiplatform
+
+    def load_model(self, client, model):
+        from vertexai.language_models import TextGenerationModel
+        return TextGenerationModel.from_pretrained(model)
+
+    def complete(self, handle, model, prompt, max_tokens):
+        response = handle.predict(prompt)
+        return Completion(response.text, estimate_tokens(prompt), estimate_tokens(response.text))
+
+class MockProviderError(Exception):
+    """Simulated transient provider failure"""
+
+    def __init__(self, message, status_code=503):
+        super().__init__(message)
+        self.status_code = status_code
+
+_NUMBERED_LINE = re.compile(r"^(\d+)\. (.+)$", re.MULTILINE)
+
+class MockProvider(LLMProvider):
+    """Local stand-in backend for tests and benchmarks, no network or API keys needed.
+
+    latency is a callable returning seconds to sleep per call, or a
+    (median, sigma) pair for log-normally distributed latency. A fraction
+    error_rate of calls fails with a retryable MockProviderError. responses
+    scripts the output: a callable taking the prompt, or a list of strings
+    returned in rotation. Without a script, the response is derived from a
+    hash of the prompt, so identical prompts always get identical answers.
+    Embeddings are likewise unit vectors seeded by each text.
+    """
+
+    # Simulated responses must never be served to real runs from the cache
+    cacheable = False
+
+    def __init__(self, latency=None, error_rate=0.0, responses=None, seed=0, embedding_dim=64):
+        super().__init__()
+        self.embedding_dim = embedding_dim
+        self.latency = latency
+        self.error_rate = error_rate
+        self.responses = responses
+        self.calls = 0
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+
+    def create_client(self):
+        return self
+
+    def _sample(self):
+        with self._random_lock:
+            self.calls += 1
+            call = self.calls
+            fail = self._random.random() < self.error_rate
+            if callable(self.latency):
+                delay = self.latency()
+            elif self.latency:
+                median, sigma = self.latency
+                delay = median * math.exp(self._random.gauss(0.0, sigma))
+            else:
+                delay = 0.0
+        return call, fail, delay
+
+    def _respond(self, call, prompt):
+        if callable(self.responses):
+            return self.responses(prompt)
+        if self.responses:
+            return self.responses[(call - 1) % len(self.responses)]
+        if "Triples to assess:" in prompt:
+            # Packed request: one JSON verdict per numbered triple
+            listed = _NUMBERED_LINE.findall(prompt.split("Triples to assess:", 1)[1])
+            verdicts = []
+            for number, line in listed:
+                verdict, confidence = self._verdict(line)
+                verdicts.append({"id": int(number), "verdict": verdict, "confidence": confidence,
+                                 "reasoning": "Mock analysis of the triple."})
+            return json.dumps(verdicts)
+        verdict, confidence = self._verdict(prompt)
+        return f"Verdict: {verdict}. Confidence: {confidence:.2f}. Mock analysis of the prompt."
+
+    @staticmethod
+    def _verdict(text):
+        digest = hashlib.sha256(text.encode("utf-8")).digest()
+        return ("valid" if digest[0] % 4 else "error"), round(0.5 + digest[1] / 510, 2)
+
+    def complete(self, handle, model, prompt, max_tokens):
+        call, fail, delay = self._sample()
+        if delay > 0:
+            time.sleep(delay)
+        if fail:
+            raise MockProviderError("Simulated provider error")
+        text = self._respond(call, prompt)
+        return Completion(text, estimate_tokens(prompt), estimate_tokens(text))
+
+    def embed(self, handle, model, texts):
+        call, fail, delay = self._sample()
+        if delay > 0:
+            time.sleep(delay)
+        if fail:
+            raise MockProviderError("Simulated provider error")
+        # Unit vectors seeded by the text, so equal texts get equal embeddings
+        vectors = []
+        for text in texts:
+            rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+            vector = [rng.gauss(0.0, 1.0) for _ in range(self.embedding_dim)]
+            norm = math.sqrt(sum(v * v for v in vector))
+            vectors.append([v / norm for v in vector])
+        return vectors
+
+# Built-in providers, by the name agents refer to them with
+PROVIDER_CLASSES = {
+    'openai': OpenAIProvider,
+    'anthropic': AnthropicProvider,
+    'cohere': CohereProvider,
+    'vertex': VertexProvider,
+    'mock': MockProvider
+}
+
+def estimate_tokens(text):
+    """Rough token count (about four characters per token) for rate limiting"""
+    return len(text) // 4 + 1
+
+class TokenBucket:
+    """Token bucket refilled continuously at rate_per_minute, holding at most one minute's worth.
+
+    acquire() reserves capacity immediately and then sleeps until the
+    reservation is covered, so concurrent callers are served in arrival order
+    and throughput stays at the configured rate instead of bursting into errors.
+    """
+
+    def __init__(self, rate_per_minute):
+        self.capacity = float(rate_per_minute)
+        self.rate = rate_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+class RateLimiter:
+    """Requests-per-minute and tokens-per-minute limits of one provider"""
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+
+    def acquire(self, tokens):
+        waited = 0.0
+        if self.requests is not None:
+            waited += self.requests.acquire(1)
+        if self.tokens is not None:
+            waited += self.tokens.acquire(tokens)
+        return waited
+
+def is_retryable(error):
+    """Whether a provider error is transient (rate limit, timeout, server error)"""
+    status = getattr(error, 'status_code', None)
+    if status is None:
+        status = getattr(error, 'code', None)
+    try:
+        if int(status) in RETRYABLE_STATUS_CODES:
+            return True
+    except (TypeError, ValueError):
+        pass
+    name = type(error).__name__
+    return any(marker in name for marker in ('RateLimit', 'Timeout', 'Connection', 'Unavailable', 'ResourceExhausted'))
+
+def _retry_after(error):
+    """Delay requested by the provider through a Retry-After header, if any"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if not headers:
+        return None
+    try:
+        return float(headers.get('retry-after'))
+    except (TypeError, ValueError):
+        return None
+
+class ProviderRegistry:
+    """Hands out one shared provider backend per name and paces calls to each.
+
+    Agents using the same provider share its client, connection pool and rate
+    limits. Transient failures are retried with exponential backoff and full
+    jitter, honouring Retry-After when the provider sends it. Any LLMProvider
+    can be registered under a name, e.g. a MockProvider for offline runs.
+    """
+
+    def __init__(self, rate_limits=PROVIDER_RATE_LIMITS, max_retries=PROVIDER_MAX_RETRIES,
+                 base_delay=PROVIDER_RETRY_BASE_DELAY, max_delay=PROVIDER_RETRY_MAX_DELAY):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._providers = {}
+        self._limiters = {
+            provider: RateLimiter(**limits) for provider, limits in rate_limits.items()
+        }
+        self._lock = threading.Lock()
+        self.stats = {'calls': 0, 'retries': 0, 'throttled_seconds': 0.0}
+
+    def register(self, name, provider, rate_limits=None):
+        """Use provider for name, optionally with its own rate limits"""
+        with self._lock:
+            self._providers[name] = provider
+            if rate_limits is not None:
+                self._limiters[name] = RateLimiter(**rate_limits)
+
+    def get(self, name):
+        """Return the provider registered under name, creating a built-in one on first use"""
+        with self._lock:
+            if name not in self._providers:
+                self._providers[name] = PROVIDER_CLASSES[name]()
+            return self._providers[name]
+
+    def get_client(self, name):
+        """Return the shared client for a provider, or None if it cannot be created"""
+        return self.get(name).client
+
+    def get_model(self, name, model):
+        """Return the shared handle for a provider's model, loading it on first use"""
+        return self.get(name).model_handle(model)
+
+    def complete(self, name, model, prompt, max_tokens=1000):
+        """Send a prompt through a provider under its rate limits and return a Completion"""
+        provider = self.get(name)
+        tokens = estimate_tokens(prompt) + max_tokens
+        return self.call(
+            name,
+            lambda: provider.complete(provider.model_handle(model), model, prompt, max_tokens),
+            tokens=tokens
+        )
+
+    def embed(self, name, model, texts):
+        """Embed a batch of texts through a provider under its rate limits"""
+        provider = self.get(name)
+        return self.call(
+            name,
+            lambda: provider.embed(provider.model_handle(model), model, texts),
+            tokens=sum(estimate_tokens(text) for text in texts)
+        )
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats = {'calls': 0, 'retries': 0, 'throttled_seconds': 0.0}
+
+    def call(self, provider, request, tokens=1):
+        """Run request() under the provider's rate limits, retrying transient errors"""
+        limiter = self._limiters.get(provider)
+        span = current_span()
+        for attempt in range(self.max_retries + 1):
+            if limiter is not None:
+                waited = limiter.acquire(tokens)
+                if waited:
+                    with self._lock:
+                        self.stats['throttled_seconds'] += waited
+                    span.increment('throttled_ms', waited * 1000)
+            span.increment('llm_calls')
+            try:
+                with self._lock:
+                    self.stats['calls'] += 1
+                return request()
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                delay = _retry_after(e)
+                if delay is None:
+                    delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                logger.warning(f"{provider} call failed ({e}), retrying in {delay:.1f}s")
+                with self._lock:
+                    self.stats['retries'] += 1
+                span.increment('retries')
+                time.sleep(delay)
+
+_registry = None
+_registry_lock = threading.Lock()
+
+def get_provider_registry():
+    """Return the process-wide provider registry shared by all agents"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ProviderRegistry()
+        return _registry
@@ -0,0 +1,141 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from config import RESULTS_STORE_PATH
+
+class ResultsStore:
+    """Append-only SQLite store of detection results, kept across runs.
+
+    Each row holds a triple as text, its id (a hash of head, relation and
+    tail, by which rows are indexed and looked up), the graph version it was
+    judged under, the verdict ('error', 'valid' or NULL when undecided), each
+    agent's verdict and confidence as JSON, the discussion rounds and the
+    latency in seconds. Rows are never updated. If a triple is judged again
+    under the same version, the latest row wins. The SQLite file can be
+    shared by several processes.
+    """
+
+    def __init__(self, path=RESULTS_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                id INTEGER PRIMARY KEY,
+                triple_id TEXT NOT NULL,
+                head TEXT NOT NULL,
+                relation TEXT NOT NULL,
+                tail TEXT NOT NULL,
+                graph_version TEXT NOT NULL,
+                verdict TEXT,
+                agents TEXT NOT NULL,
+                rounds INTEGER,
+                latency REAL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS results_triple_id ON results (triple_id, graph_version)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS results_relation ON results (relation, verdict)")
+        self._conn.commit()
+
+    @staticmethod
+    def triple_id(triple):
+        return hashlib.sha1("\t".join(map(str, triple)).encode("utf-8")).hexdigest()[:16]
+
+    def record(self, triple, graph_version, result, rounds=None, latency=None):
+        """Append the (is_error, decision_msg, agent_results) result of triple"""
+        is_error, _, agent_results = result
+        verdict = None if is_error is None else ('error' if is_error else 'valid')
+        agents = {
+            name: [agent.get('verdict'), agent['confidence']]
+            for name, agent in agent_results.items()
+        }
+        head, relation, tail = map(str, triple)
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO results (triple_id, head, relation, tail, graph_version, verdict, agents, "
+                "rounds, latency, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (self.triple_id(triple), head, relation, tail, str(graph_version), verdict,
+                 json.dumps(agents), rounds, latency, time.time())
+            )
+            self._conn.commit()
+
+    def lookup(self, triple, graph_version):
+        """Latest decided result of triple under graph_version, or None.
+
+        The result has the shape detect_error returns. Agent reasoning is not
+        stored, so each agent result has only its verdict and confidence.
+        """
+        head, relation, tail = map(str, triple)
+        with self._lock:
+            # The values are compared as well, so an id collision cannot return another triple
+            row = self._conn.execute(
+                "SELECT verdict, agents, rounds FROM results "
+                "WHERE triple_id = ? AND graph_version = ? AND head = ? AND relation = ? AND tail = ? "
+                "ORDER BY id DESC LIMIT 1",
+                (self.triple_id(triple), str(graph_version), head, relation, tail)
+            ).fetchone()
+        if row is None or row[0] is None:
+            return None
+        verdict, agents, rounds = row
+        agent_results = {
+            name: {'verdict': agent_verdict, 'confidence': confidence, 'reasoning': ''}
+            for name, (agent_verdict, confidence) in json.loads(agents).items()
+        }
+        return verdict == 'error', f"Judged in an earlier run after {rounds} rounds", agent_results
+
+    def _latest(self, graph_version):
+        """SQL and parameters selecting the ids of the latest row per triple, across versions if None"""
+        if graph_version is None:
+            return "SELECT MAX(id) FROM results GROUP BY triple_id", ()
+        return ("SELECT MAX(id) FROM results WHERE graph_version = ? GROUP BY triple_id",
+                (str(graph_version),))
+
+    def error_rate_by_relation(self, graph_version=None):
+        """[(relation, decided triples, errors, error rate)] over the latest result per triple"""
+        latest, params = self._latest(graph_version)
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT relation, COUNT(*), SUM(verdict = 'error') FROM results "
+                f"WHERE id IN ({latest}) AND verdict IS NOT NULL "
+                "GROUP BY relation ORDER BY relation",
+                params
+            ).fetchall()
+        return [(relation, judged, errors, errors / judged) for relation, judged, errors in rows]
+
+    def stats(self, graph_version=None):
+        """Counts and mean latency and rounds over the latest result per triple"""
+        latest, params = self._latest(graph_version)
+        with self._lock:
+            judged, errors, undecided, latency, rounds = self._conn.execute(
+                "SELECT COUNT(*), SUM(verdict = 'error'), SUM(verdict IS NULL), AVG(latency), AVG(rounds) "
+                f"FROM results WHERE id IN ({latest})",
+                params
+            ).fetchone()
+        return {
+            'triples': judged,
+            'errors': errors or 0,
+            'undecided': undecided or 0,
+            'mean_latency': latency,
+            'mean_rounds': rounds
+        }
+
+    def query(self, sql, params=()):
+        """Run a read-only query against the results table, e.g. for other aggregates"""
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,104 @@
+import logging
+import torch
+import torch.nn.functional as F
+from config import GCN_HIDDEN_CHANNELS
+
+logger = logging.getLogger(__name__)
+
+class PlausibilityScorer(torch.nn.Module):
+    """DistMult link scorer over GCN node embeddings.
+
+    A triple (h, r, t) scores sigmoid(sum(e_h * w_r * e_t)), where w_r is a
+    learned diagonal per relation. Scoring is a single vectorized op over a
+    whole batch of triples.
+    """
+
+    def __init__(self, num_relations, dim=GCN_HIDDEN_CHANNELS):
+        super().__init__()
+        self.relation = torch.nn.Embedding(num_relations, dim)
+        torch.nn.init.ones_(self.relation.weight)
+
+    def forward(self, head_emb, relation_ids, tail_emb):
+        """Return raw logits for a batch of triples"""
+        return (head_emb * self.relation(relation_ids) * tail_emb).sum(dim=-1)
+
+    def score(self, head_emb, relation_ids, tail_emb):
+        """Plausibility in [0, 1] for a batch of triples"""
+        return torch.sigmoid(self.forward(head_emb, relation_ids, tail_emb))
+
+    def save(self, path):
+        """Save the trained weights with the shape needed to rebuild the scorer"""
+        torch.save({
+            'num_relations': self.relation.num_embeddings,
+            'dim': self.relation.embedding_dim,
+            'state_dict': self.state_dict()
+        }, path)
+
+    @classmethod
+    def load(cls, path):
+        """Rebuild a scorer saved with save, in eval mode"""
+        checkpoint = torch.load(path, map_location='cpu', weights_only=True)
+        scorer = cls(checkpoint['num_relations'], checkpoint['dim'])
+        scorer.load_state_dict(checkpoint['state_dict'])
+        scorer.eval()
+        return scorer
+
+def _corrupt(edge_index, num_nodes):
+    """Negative samples: replace the head or the tail of each edge with a random node"""
+    heads, tails = edge_index[0].clone(), edge_index[1].clone()
+    random_nodes = torch.randint(num_nodes, heads.shape)
+    replace_head = torch.rand(heads.shape) < 0.5
+    heads[replace_head] = random_nodes[replace_head]
+    tails[~replace_head] = random_nodes[~replace_head]
+    return heads, tails
+
+def train_plausibility_scorer(scorer, encoder, graph_context, epochs=50, batch_size=4096,
+                              lr=0.01, train_encoder=False):
+    """Train the scorer offline on the graph's own edges against corrupted negatives.
+
+    With train_encoder=False the GCN embeddings are computed once and frozen,
+    so each step only touches the scorer. With train_encoder=True the encoder
+    is fine-tuned jointly, running a full-graph forward pass per step.
+    """
+    x, edge_index = graph_context['x'], graph_context['edge_index']
+    edge_type = graph_context['edge_type']
+    num_nodes = len(graph_context['node_to_id'])
+    num_edges = edge_index.shape[1]
+
+    params = list(scorer.parameters())
+    if train_encoder:
+        params += list(encoder.parameters())
+        encoder.train()
+    else:
+        encoder.eval()
+        with torch.no_grad():
+            frozen = encoder(x, edge_index)
+    optimizer = torch.optim.Adam(params, lr=lr)
+    scorer.train()
+
+    for epoch in range(epochs):
+        permutation = torch.randperm(num_edges)
+        total_loss = 0.0
+        for start in range(0, num_edges, batch_size):
+            batch = permutation[start:start + batch_size]
+            pos = edge_index[:, batch]
+            relations = edge_type[batch]
+            neg_heads, neg_tails = _corrupt(pos, num_nodes)
+
+            emb = encoder(x, edge_index) if train_encoder else frozen
+            pos_logits = scorer(emb[pos[0]], relations, emb[pos[1]])
+            neg_logits = scorer(emb[neg_heads], relations, emb[neg_tails])
+            loss = (
+                F.binary_cross_entropy_with_logits(pos_logits, torch.ones_like(pos_logits))
+                + F.binary_cross_entropy_with_logits(neg_logits, torch.zeros_like(neg_logits))
+            )
+
+            optimizer.zero_grad()
+            loss.backward()
+            optimizer.step()
+            total_loss += loss.item() * len(batch)
+        logger.info(f"Screening scorer epoch {epoch + 1}/{epochs}: loss {total_loss / max(num_edges, 1):.4f}")
+
+    scorer.eval()
+    encoder.eval()
+    return scorer
@@ -0,0 +1,439 @@
+"""Validate a knowledge graph dump with many MAKGED worker processes.
+
+Triples are partitioned by head entity into shards, so triples about the same
+entity share one worker's neighborhood index and response cache. Shards are
+handed out through a work queue in a directory. Claiming a shard is an
+atomic rename, and a worker keeps its lease alive with a heartbeat. Shards of
+workers that crash or stall are requeued, up to SHARD_MAX_ATTEMPTS attempts,
+and crashed worker processes are replaced up to SHARD_MAX_RESTARTS times.
+Finished shards are merged into one JSON lines file in input order.
+
+On one machine, `run` does everything with N local worker processes:
+
+    python sharding.py run kg.nt --output results.jsonl --workers 8
+
+Across machines sharing a filesystem, partition once, start workers on every
+machine, then merge:
+
+    python sharding.py partition kg.nt --queue /shared/kg-queue --shards 256
+    python sharding.py worker --queue /shared/kg-queue --processes 8   # on each machine
+    python sharding.py merge --queue /shared/kg-queue --output results.jsonl
+"""
+import argparse
+import heapq
+import json
+import logging
+import multiprocessing
+import os
+import socket
+import threading
+import time
+import zlib
+from config import (GCN_WEIGHTS_PATH, NODE_FEATURES, RESULTS_STORE_PATH, SHARD_COUNT, SHARD_LEASE_SECONDS,
+                    SHARD_MAX_ATTEMPTS, SHARD_MAX_RESTARTS)
+from ingest import read_triples
+
+logger = logging.getLogger(__name__)
+
+STATES = ('pending', 'running', 'done', 'failed')
+
+def shard_of(head, num_shards):
+    """Stable shard of a head entity, the same in every process and machine"""
+    return zlib.crc32(head.encode('utf-8')) % num_shards
+
+class ShardQueue:
+    """Shards of one validation run and their state, kept in a directory.
+
+    shards/ holds the triples of each shard as JSON lines with their input
+    position. A shard's task file moves between pending/, running/ (named
+    <shard>@<worker> while leased), done/ and failed/. Every move is a
+    rename, so processes on several machines can share the queue through a
+    filesystem with atomic renames.
+    """
+
+    def __init__(self, path, lease_seconds=SHARD_LEASE_SECONDS, max_attempts=SHARD_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    def _dir(self, name):
+        return os.path.join(self.path, name)
+
+    def shard_path(self, shard):
+        return os.path.join(self._dir('shards'), shard + '.jsonl')
+
+    def result_path(self, shard):
+        return os.path.join(self._dir('results'), shard + '.jsonl')
+
+    @property
+    def manifest(self):
+        with open(os.path.join(self.path, 'manifest.json'), encoding='utf-8') as f:
+            return json.load(f)
+
+    @classmethod
+    def create(cls, path, source, num_shards=SHARD_COUNT, format=None, **settings):
+        """Partition source into num_shards shards by head entity and queue them all.
+
+        settings (graph, graph_format, node_features, gcn_weights,
+        concurrency, ...) are stored in the manifest for the workers. With
+        screen_epochs, the screening scorer is trained here once and saved in
+        the queue, so every worker screens with the same one.
+        """
+        queue = cls(path)
+        if os.path.exists(os.path.join(path, 'manifest.json')):
+            raise ValueError(f"{path} already holds a queue")
+        for name in STATES + ('shards', 'results'):
+            os.makedirs(queue._dir(name), exist_ok=True)
+
+        names = [f"shard-{i:05d}" for i in range(num_shards)]
+        files = [open(queue.shard_path(name), 'w', encoding='utf-8') for name in names]
+        try:
+            for position, (head, relation, tail) in enumerate(read_triples(source, format)):
+                record = {'position': position, 'head': head, 'relation': relation, 'tail': tail}
+                files[shard_of(head, num_shards)].write(json.dumps(record) + '\n')
+        finally:
+            for f in files:
+                f.close()
+
+        screen_epochs = settings.pop('screen_epochs', 0)
+        if screen_epochs:
+            settings['scorer'] = _train_scorer(path, source, screen_epochs, settings)
+
+        for name in names:
+            with open(os.path.join(queue._dir('pending'), name), 'w', encoding='utf-8') as f:
+                json.dump({'attempts': 0}, f)
+        manifest = dict(settings, source=os.path.abspath(source), num_shards=num_shards)
+        with open(os.path.join(path, 'manifest.json'), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        return queue
+
+    def _tasks(self, state):
+        return sorted(name for name in os.listdir(self._dir(state)) if not name.startswith('.'))
+
+    def status(self):
+        """Number of shards in each state"""
+        return {state: len(self._tasks(state)) for state in STATES}
+
+    def finished(self):
+        status = self.status()
+        return status['pending'] == 0 and status['running'] == 0
+
+    def claim(self, worker):
+        """Lease the next pending shard to worker, or return None if there is none"""
+        for shard in self._tasks('pending'):
+            lease = os.path.join(self._dir('running'), f"{shard}@{worker}")
+            try:
+                os.rename(os.path.join(self._dir('pending'), shard), lease)
+            except FileNotFoundError:
+                continue  # Claimed by another worker first
+            os.utime(lease)
+            return lease
+        return None
+
+    def heartbeat(self, lease):
+        """Extend a lease; returns False if it was lost to a requeue"""
+        try:
+            os.utime(lease)
+            return True
+        except FileNotFoundError:
+            return False
+
+    def _move(self, lease, state, shard):
+        try:
+            os.rename(lease, os.path.join(self._dir(state), shard))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def complete(self, lease, output):
+        """Publish a leased shard's results, unless the lease was lost meanwhile"""
+        shard = os.path.basename(lease).split('@')[0]
+        if not self.heartbeat(lease):
+            _remove(output)  # The requeue may have removed it already
+            return False
+        os.replace(output, self.result_path(shard))
+        return self._move(lease, 'done', shard)
+
+    def release(self, lease):
+        """Give a shard back after a failed attempt, or fail it for good after max_attempts"""
+        shard = os.path.basename(lease).split('@')[0]
+        # Hidden while its attempt count is updated, so nobody claims it meanwhile
+        staging = os.path.join(self._dir('pending'), f".{shard}")
+        try:
+            os.rename(lease, staging)
+        except FileNotFoundError:
+            return  # Already requeued by someone else
+        # Partial output of the attempt, possibly still written by a stalled worker
+        results = self._dir('results')
+        for name in os.listdir(results):
+            if name.startswith(shard + '@'):
+                os.remove(os.path.join(results, name))
+        with open(staging, encoding='utf-8') as f:
+            attempts = json.load(f)['attempts'] + 1
+        with open(staging, 'w', encoding='utf-8') as f:
+            json.dump({'attempts': attempts}, f)
+        if attempts >= self.max_attempts:
+            logger.error(f"{shard} failed {attempts} times, giving up on it")
+            os.rename(staging, os.path.join(self._dir('failed'), shard))
+        else:
+            os.rename(staging, os.path.join(self._dir('pending'), shard))
+
+    def requeue_stale(self):
+        """Release shards whose worker stopped sending heartbeats"""
+        now = time.time()
+        for name in self._tasks('running'):
+            lease = os.path.join(self._dir('running'), name)
+            try:
+                stale = now - os.stat(lease).st_mtime > self.lease_seconds
+            except FileNotFoundError:
+                continue
+            if stale:
+                logger.warning(f"Lease {name} expired, requeueing")
+                self.release(lease)
+
+    def merge(self, output_path):
+        """Merge the results of done shards into output_path in input order.
+
+        Records get their input position back. Returns the number of shards
+        that failed for good and are missing from the output.
+        """
+        sorted_dir = self._dir('sorted')
+        os.makedirs(sorted_dir, exist_ok=True)
+        paths = []
+        for shard in self._tasks('done'):
+            with open(self.shard_path(shard), encoding='utf-8') as f:
+                positions = [json.loads(line)['position'] for line in f]
+            with open(self.result_path(shard), encoding='utf-8') as f:
+                records = [json.loads(line) for line in f]
+            # validate_stream numbers records by their line in the shard file
+            for record in records:
+                record['position'] = positions[record['position']]
+            records.sort(key=lambda record: record['position'])
+            path = os.path.join(sorted_dir, shard + '.jsonl')
+            with open(path, 'w', encoding='utf-8') as f:
+                f.writelines(json.dumps(record) + '\n' for record in records)
+            paths.append(path)
+
+        files = [open(path, encoding='utf-8') for path in paths]
+        try:
+            streams = [map(json.loads, f) for f in files]
+            with open(output_path, 'w', encoding='utf-8') as out:
+                for record in heapq.merge(*streams, key=lambda record: record['position']):
+                    out.write(json.dumps(record) + '\n')
+        finally:
+            for f in files:
+                f.close()
+        for path in paths:
+            os.remove(path)
+        return len(self._tasks('failed'))
+
+def _load_context(source, settings):
+    from graph_data import load_graph
+    return load_graph(settings.get('graph') or source, settings.get('graph_format'),
+                      settings.get('node_features', NODE_FEATURES))
+
+def _train_scorer(path, source, epochs, settings):
+    """Train the screening scorer of a queue and return the path it is saved at"""
+    from makged import MAKGED
+    from validate import load_or_train_scorer
+
+    graph_context = _load_context(os.path.abspath(source), settings)
+    makged = MAKGED()
+    makged.initialize_gcn(graph_context['num_features'], graph_context['num_embeddings'],
+                          settings.get('gcn_weights'))
+    scorer_path = os.path.join(os.path.abspath(path), 'scorer.pt')
+    load_or_train_scorer(makged, graph_context, scorer_path, epochs)
+    return scorer_path
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+def _heartbeat(queue, lease, stop, lost):
+    while not stop.wait(queue.lease_seconds / 3):
+        if not queue.heartbeat(lease):
+            logger.warning(f"Lost lease {os.path.basename(lease)}, abandoning the shard")
+            lost.set()
+            return
+
+def run_worker(queue_path, lease_seconds=SHARD_LEASE_SECONDS, max_attempts=SHARD_MAX_ATTEMPTS):
+    """Process shards from the queue until none are left. Returns the number processed."""
+    # Imported here so runner and queue tools start without torch and provider SDKs
+    from makged import MAKGED
+    from results_store import ResultsStore
+    from validate import load_or_train_scorer, validate_stream
+
+    queue = ShardQueue(queue_path, lease_seconds, max_attempts)
+    manifest = queue.manifest
+    worker = f"{socket.gethostname()}-{os.getpid()}"
+    graph_context = _load_context(manifest['source'], manifest)
+    options = {'results_store': ResultsStore(manifest['results_store'])} if manifest.get('results_store') else {}
+    if manifest.get('concurrency') is not None:
+        options['max_concurrency'] = manifest['concurrency']
+    makged = MAKGED(**options)
+    if not manifest.get('gcn_weights') and not manifest.get('scorer'):
+        logger.warning("No GCN weights in the manifest, every worker uses its own random GCN")
+    makged.initialize_gcn(graph_context['num_features'], graph_context['num_embeddings'],
+                          manifest.get('gcn_weights'))
+    screen = manifest.get('scorer') is not None
+    if screen:
+        # Trained once at partitioning; loads the GCN it was trained with as well
+        load_or_train_scorer(makged, graph_context, manifest['scorer'], 0)
+    makged.warmup(graph_context)
+
+    processed = 0
+    while True:
+        queue.requeue_stale()
+        lease = queue.claim(worker)
+        if lease is None:
+            if queue.finished():
+                return processed
+            # Other workers still hold leases that may expire
+            time.sleep(min(queue.lease_seconds / 3, 10))
+            continue
+
+        shard = os.path.basename(lease).split('@')[0]
+        output = os.path.join(queue._dir('results'), f"{shard}@{worker}.jsonl")
+        stop, lost = threading.Event(), threading.Event()
+        heartbeat = threading.Thread(target=_heartbeat, args=(queue, lease, stop, lost), daemon=True)
+        heartbeat.start()
+        try:
+            # A lost lease stops the shard: its results would be discarded anyway
+            validate_stream(makged, queue.shard_path(shard), graph_context, output, format='jsonl',
+                            screen=screen, packed=manifest.get('packed', False), stop=lost)
+        except Exception as e:
+            logger.error(f"{worker} failed on {shard}: {e}")
+            queue.release(lease)
+            continue
+        finally:
+            stop.set()
+            heartbeat.join()
+        _remove(output + '.checkpoint')
+        if queue.complete(lease, output):
+            processed += 1
+            print(f"{worker}: finished {shard}")
+
+def _start_workers(queue_path, processes):
+    # Fresh interpreters: forking a process that already loaded torch is unsafe
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=run_worker, args=(queue_path,)) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    return workers
+
+def run_workers(queue_path, processes, max_restarts=SHARD_MAX_RESTARTS):
+    """Run worker processes until the queue is drained, replacing any that die early.
+
+    After max_restarts replacements, crashed workers are no longer replaced;
+    if they all die before the queue is drained, RuntimeError is raised and
+    the queue can be resumed later.
+    """
+    queue = ShardQueue(queue_path)
+    workers = _start_workers(queue_path, processes)
+    restarts = 0
+    while workers:
+        time.sleep(1)
+        alive = [worker for worker in workers if worker.is_alive()]
+        crashed = [worker for worker in workers if not worker.is_alive() and worker.exitcode != 0]
+        if crashed and not queue.finished():
+            queue.requeue_stale()
+            replacements = min(len(crashed), max_restarts - restarts)
+            if replacements > 0:
+                logger.warning(f"{len(crashed)} worker(s) died, starting {replacements} replacement(s)")
+                alive += _start_workers(queue_path, replacements)
+                restarts += replacements
+            else:
+                logger.error(f"{len(crashed)} worker(s) died after {restarts} restarts, not replacing them")
+        workers = alive
+    if not queue.finished():
+        raise RuntimeError(f"All workers died with shards left ({queue.status()}), "
+                           f"resume with: python sharding.py worker --queue {queue_path}")
+
+def run_sharded(source, output_path, queue_path=None, processes=os.cpu_count(), num_shards=SHARD_COUNT,
+                format=None, **settings):
+    """Partition, validate with local worker processes and merge, all on this machine.
+
+    An existing queue at queue_path is resumed instead of partitioned again.
+    Returns the number of shards that failed for good.
+    """
+    queue_path = queue_path or output_path + '.queue'
+    if not os.path.exists(os.path.join(queue_path, 'manifest.json')):
+        print(f"Partitioning {source} into {num_shards} shards...")
+        ShardQueue.create(queue_path, source, num_shards, format, **settings)
+    print(f"Validating with {processes} worker processes...")
+    run_workers(queue_path, processes)
+    return ShardQueue(queue_path).merge(output_path)
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate knowledge graph triples with many MAKGED workers")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_partition_arguments(command):
+        command.add_argument('input', help="Triples to validate (.tsv, .nt or .jsonl)")
+        command.add_argument('--format', choices=['tsv', 'nt', 'jsonl'])
+        command.add_argument('--shards', type=int, default=SHARD_COUNT)
+        command.add_argument('--graph', help="Graph providing the context, defaults to the input itself")
+        command.add_argument('--graph-format', choices=['tsv', 'nt', 'jsonl'])
+        command.add_argument('--node-features', default=NODE_FEATURES,
+                             choices=['sparse', 'identity', 'embedding'])
+        command.add_argument('--gcn-weights', default=GCN_WEIGHTS_PATH,
+                             help="Trained GCN weights saved with MAKGED.save_gcn, read by every worker")
+        command.add_argument('--screen-epochs', type=int, default=0,
+                             help="Train the structural screen for this many epochs once, before "
+                                  "queueing, and only send suspicious triples to the agents")
+        command.add_argument('--concurrency', type=int, help="Triples in flight per worker")
+        command.add_argument('--packed', action='store_true',
+                             help="Analyze triples sharing an entity in one request per agent")
+        command.add_argument('--results-store', nargs='?', const=RESULTS_STORE_PATH,
+                             help="SQLite results store shared by the workers of one machine")
+
+    run = commands.add_parser('run', help="Partition, validate and merge on this machine")
+    add_partition_arguments(run)
+    run.add_argument('--output', required=True)
+    run.add_argument('--queue', help="Queue directory, defaults to OUTPUT.queue")
+    run.add_argument('--workers', type=int, default=os.cpu_count())
+
+    partition = commands.add_parser('partition', help="Create a queue for workers on several machines")
+    add_partition_arguments(partition)
+    partition.add_argument('--queue', required=True)
+
+    worker = commands.add_parser('worker', help="Process shards from a queue")
+    worker.add_argument('--queue', required=True)
+    worker.add_argument('--processes', type=int, default=1)
+
+    merge = commands.add_parser('merge', help="Merge the results of a drained queue")
+    merge.add_argument('--queue', required=True)
+    merge.add_argument('--output', required=True)
+    args = parser.parse_args()
+
+    if args.command in ('run', 'partition'):
+        settings = {
+            'graph': os.path.abspath(args.graph) if args.graph else None,
+            'graph_format': args.graph_format,
+            'node_features': args.node_features,
+            'gcn_weights': os.path.abspath(args.gcn_weights) if args.gcn_weights else None,
+            'screen_epochs': args.screen_epochs,
+            'concurrency': args.concurrency,
+            'packed': args.packed,
+            'results_store': os.path.abspath(args.results_store) if args.results_store else None
+        }
+    if args.command == 'run':
+        failed = run_sharded(args.input, args.output, args.queue, args.workers, args.shards,
+                             args.format, **settings)
+    elif args.command == 'partition':
+        ShardQueue.create(args.queue, args.input, args.shards, args.format, **settings)
+        print(f"Queued {args.shards} shards in {args.queue}")
+        return
+    elif args.command == 'worker':
+        run_workers(args.queue, args.processes)
+        return
+    else:
+        failed = ShardQueue(args.queue).merge(args.output)
+    print(f"\nResults in {args.output}")
+    if failed:
+        print(f"{failed} shard(s) failed, see {os.path.join(args.queue or args.output + '.queue', 'failed')}")
+
+if __name__ == "__main__":
+    main()
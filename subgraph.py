@@ -0,0 +1,107 @@
+import torch
+from config import SUBGRAPH_NUM_HOPS, SUBGRAPH_MAX_FANOUT
+
+class NeighborhoodExtractor:
+    """Directional k-hop neighborhoods of a knowledge graph, rendered as compact triples.
+
+    Adjacency is indexed once per graph (CSR-style, by source and by target),
+    so each lookup only touches the edges it returns.
+    """
+
+    def __init__(self, graph_context, num_hops=SUBGRAPH_NUM_HOPS, max_fanout=SUBGRAPH_MAX_FANOUT):
+        self.num_hops = num_hops
+        self.max_fanout = max_fanout
+        self.node_to_id = graph_context['node_to_id']
+        self.id_to_node = [None] * len(self.node_to_id)
+        for node, node_id in self.node_to_id.items():
+            self.id_to_node[node_id] = node
+        self.relations = graph_context.get('relations')
+        edge_type = graph_context.get('edge_type')
+        self.edge_type = edge_type.tolist() if edge_type is not None else None
+
+        edge_index = graph_context['edge_index'].cpu()
+        self.src = edge_index[0].tolist()
+        self.dst = edge_index[1].tolist()
+        num_nodes = len(self.id_to_node)
+        self._index = {
+            'out': self._build_index(edge_index[0], num_nodes),
+            'in': self._build_index(edge_index[1], num_nodes)
+        }
+
+    @staticmethod
+    def _build_index(keys, num_nodes):
+        """Group edge ids by node: edges of node v are order[ptr[v]:ptr[v + 1]]"""
+        order = torch.argsort(keys, stable=True)
+        ptr = torch.zeros(num_nodes + 1, dtype=torch.long)
+        ptr[1:] = torch.cumsum(torch.bincount(keys, minlength=num_nodes), dim=0)
+        return ptr.tolist(), order.tolist()
+
+    def _relation(self, edge_id):
+        if self.edge_type is None:
+            return "related to"
+        return self.relations[self.edge_type[edge_id]]
+
+    def neighborhood(self, entity, direction, exclude=None):
+        """Collect (head, relation, tail) triples reachable from entity.
+
+        direction is 'out' to follow edges where the entity is the head, or
+        'in' to follow edges where it is the tail. At most max_fanout edges are
+        expanded per node and hop. Triples in the exclude set are skipped so the
+        triples under review are not offered as evidence for themselves.
+        """
+        exclude = exclude or ()
+        start = self.node_to_id.get(entity)
+        if start is None:
+            return []
+        ptr, order = self._index[direction]
+        triples = []
+        visited = {start}
+        frontier = [start]
+        for _ in range(self.num_hops):
+            next_frontier = []
+            for node_id in frontier:
+                taken = 0
+                for edge_id in order[ptr[node_id]:ptr[node_id + 1]]:
+                    if taken >= self.max_fanout:
+                        break
+                    triple = (
+                        self.id_to_node[self.src[edge_id]],
+                        self._relation(edge_id),
+                        self.id_to_node[self.dst[edge_id]]
+                    )
+                    if triple in exclude:
+                        continue
+                    triples.append(triple)
+                    taken += 1
+                    neighbor = self.dst[edge_id] if direction == 'out' else self.src[edge_id]
+                    if neighbor not in visited:
+                        visited.add(neighbor)
+                        next_frontier.append(neighbor)
+            frontier = next_frontier
+        return triples
+
+    def describe(self, triple, perspective):
+        """Render the neighborhood an agent needs for its (entity, direction) perspective"""
+        position, direction = perspective
+        entity = triple[0] if position == 'head' else triple[2]
+        return self._render(self.neighborhood(entity, direction, exclude={tuple(triple)}))
+
+    def describe_all(self, triple, perspectives):
+        """Render the union of the neighborhoods of several perspectives, each neighbor once"""
+        neighbors = {}
+        for position, direction in perspectives:
+            entity = triple[0] if position == 'head' else triple[2]
+            neighbors.update(dict.fromkeys(self.neighborhood(entity, direction, exclude={tuple(triple)})))
+        return self._render(list(neighbors))
+
+    def describe_group(self, triples, perspective):
+        """Render the shared neighborhood of triples that have the same entity at position"""
+        position, direction = perspective
+        entity = triples[0][0] if position == 'head' else triples[0][2]
+        return self._render(self.neighborhood(entity, direction, exclude={tuple(t) for t in triples}))
+
+    @staticmethod
+    def _render(triples):
+        if not triples:
+            return "(no known neighbors)"
+        return "\n".join(f"({h}, {r}, {t})" for h, r, t in triples)
@@ -0,0 +1,152 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+class Span:
+    """Timed stage of the pipeline with attributes and numeric counters"""
+
+    def __init__(self, name, parent, attributes):
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = dict(attributes)
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self._lock = threading.Lock()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def increment(self, key, amount=1):
+        with self._lock:
+            self.attributes[key] = self.attributes.get(key, 0) + amount
+
+    @property
+    def duration_ms(self):
+        return (self.end_ns - self.start_ns) / 1e6 if self.end_ns is not None else None
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'start_ns': self.start_ns,
+            'duration_ms': self.duration_ms,
+            'attributes': self.attributes
+        }
+
+    def to_otel(self):
+        """OpenTelemetry (OTLP JSON) style representation"""
+        return {
+            'traceId': self.trace_id,
+            'spanId': self.span_id,
+            'parentSpanId': self.parent_id or '',
+            'name': self.name,
+            'startTimeUnixNano': self.start_ns,
+            'endTimeUnixNano': self.end_ns,
+            'attributes': [
+                {'key': key, 'value': _otel_value(value)} for key, value in self.attributes.items()
+            ]
+        }
+
+def _otel_value(value):
+    if isinstance(value, bool):
+        return {'boolValue': value}
+    if isinstance(value, int):
+        return {'intValue': str(value)}
+    if isinstance(value, float):
+        return {'doubleValue': value}
+    return {'stringValue': str(value)}
+
+class _NullSpan:
+    """Stand-in used when tracing is disabled; every operation is a no-op"""
+
+    trace_id = span_id = parent_id = None
+
+    def set(self, **attributes):
+        pass
+
+    def increment(self, key, amount=1):
+        pass
+
+NULL_SPAN = _NullSpan()
+
+_current_span = contextvars.ContextVar('makged_current_span', default=NULL_SPAN)
+
+def current_span():
+    """Innermost active span of this context, or a no-op span"""
+    return _current_span.get()
+
+class Tracer:
+    """Collects spans for pipeline stages, agent calls and discussion rounds.
+
+    Spans nest through a context variable, so code deep in the call stack (the
+    response cache, provider retries) can annotate the active span through
+    current_span(). Work handed to thread pools must run in a copied context
+    (contextvars.copy_context) to keep its parent. Finished spans are kept in
+    memory, only the latest max_spans of them, or appended to path as JSON
+    lines, in the plain or OpenTelemetry style format. A disabled tracer
+    creates no spans at all.
+    """
+
+    def __init__(self, enabled=True, path=None, format='jsonl', max_spans=100_000):
+        if format not in ('jsonl', 'otel'):
+            raise ValueError(f"Unknown trace format: {format}")
+        self.enabled = enabled
+        self.path = path
+        self.format = format
+        self.spans = deque(maxlen=max_spans)
+        self._file = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name, **attributes):
+        if not self.enabled:
+            yield NULL_SPAN
+            return
+        parent = _current_span.get()
+        span = Span(name, parent if parent is not NULL_SPAN else None, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            self._finish(span)
+
+    def _finish(self, span):
+        with self._lock:
+            if self.path is None:
+                self.spans.append(span)
+                return
+            if self._file is None:
+                self._file = open(self.path, 'a', encoding='utf-8')
+            record = span.to_otel() if self.format == 'otel' else span.to_dict()
+            self._file.write(json.dumps(record) + '\n')
+            self._file.flush()
+
+    def export(self, path, format=None):
+        """Write the in-memory spans to path as JSON lines"""
+        format = format or self.format
+        with self._lock, open(path, 'w', encoding='utf-8') as f:
+            for span in self.spans:
+                record = span.to_otel() if format == 'otel' else span.to_dict()
+                f.write(json.dumps(record) + '\n')
+
+    def clear(self):
+        with self._lock:
+            self.spans.clear()
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+NOOP_TRACER = Tracer(enabled=False)
@@ -0,0 +1,148 @@
+"""Validate a knowledge graph dump with MAKGED.
+
+Triples are streamed from a TSV, N-Triples or JSONL file and results are
+appended to a JSON lines file as they complete. Progress is checkpointed, so
+an interrupted run picks up where it stopped when started again with the same
+arguments:
+
+    python validate.py kg.nt --output results.jsonl
+"""
+import argparse
+import json
+import os
+from config import CHECKPOINT_EVERY, GCN_WEIGHTS_PATH, NODE_FEATURES, RESULTS_STORE_PATH
+from graph_data import load_graph
+from ingest import Checkpoint, read_triples
+from makged import MAKGED
+from results_store import ResultsStore
+
+def load_or_train_scorer(makged, graph_context, path, epochs):
+    """Load the screening scorer saved at path, or train it for epochs and save it there.
+
+    A scorer only fits the GCN embeddings it was trained on, so the GCN is
+    saved with it as path.gcn and loaded with it again. Every process and
+    every resumed run screening with path thus gives the same verdicts.
+    """
+    gcn_path = path + '.gcn'
+    if os.path.exists(path):
+        if os.path.exists(gcn_path):
+            makged.load_gcn(gcn_path)
+        makged.load_scorer(path)
+        return
+    makged.train_screening(graph_context, epochs=epochs)
+    makged.save_gcn(gcn_path)
+    makged.save_scorer(path)
+
+def validate_stream(makged, source, graph_context, output_path, checkpoint_path=None,
+                    format=None, max_concurrency=None, screen=False, packed=False,
+                    checkpoint_every=CHECKPOINT_EVERY, stop=None):
+    """Run detection over every triple in source not yet covered by the checkpoint.
+
+    Memory stays bounded: triples are read lazily and detect_errors only pulls
+    new ones as in-flight triples finish. Once the threading.Event stop is
+    set, no new triples are started. Returns the number of triples validated
+    in this run.
+    """
+    checkpoint = Checkpoint.load(checkpoint_path or output_path + '.checkpoint', source)
+
+    # Results written after the last checkpoint belong to triples that run again
+    with open(output_path, 'ab') as out:
+        out.truncate(checkpoint.output_offset)
+
+    def remaining():
+        for position, triple in enumerate(read_triples(source, format)):
+            if stop is not None and stop.is_set():
+                return
+            if not checkpoint.is_done(position):
+                yield position, triple
+
+    validated = 0
+    with open(output_path, 'ab') as out:
+        committed = out.tell()
+        try:
+            for position, triple, (is_error, decision_msg, agent_results) in makged.detect_errors(
+                remaining(), graph_context, max_concurrency, screen=screen, with_keys=True, packed=packed
+            ):
+                head, relation, tail = triple
+                record = {
+                    'position': position,
+                    'head': head,
+                    'relation': relation,
+                    'tail': tail,
+                    'is_error': is_error,
+                    'decision': decision_msg,
+                    'agents': agent_results
+                }
+                out.write((json.dumps(record) + '\n').encode('utf-8'))
+                checkpoint.mark_done(position)
+                committed = out.tell()
+                validated += 1
+                if validated % checkpoint_every == 0:
+                    out.flush()
+                    os.fsync(out.fileno())
+                    checkpoint.save(committed)
+        finally:
+            out.flush()
+            os.fsync(out.fileno())
+            checkpoint.save(committed)
+    return validated
+
+def main():
+    parser = argparse.ArgumentParser(description="Validate knowledge graph triples with MAKGED")
+    parser.add_argument('input', help="Triples to validate (.tsv, .nt or .jsonl)")
+    parser.add_argument('--format', choices=['tsv', 'nt', 'jsonl'], help="Format of the input")
+    parser.add_argument('--graph', help="Graph providing the context, defaults to the input itself")
+    parser.add_argument('--graph-format', choices=['tsv', 'nt', 'jsonl'])
+    parser.add_argument('--output', required=True, help="JSON lines file results are appended to")
+    parser.add_argument('--checkpoint', help="Checkpoint file, defaults to OUTPUT.checkpoint")
+    parser.add_argument('--checkpoint-every', type=int, default=CHECKPOINT_EVERY)
+    parser.add_argument('--concurrency', type=int, help="Triples in flight at once")
+    parser.add_argument('--node-features', default=NODE_FEATURES,
+                        choices=['sparse', 'identity', 'embedding'])
+    parser.add_argument('--gcn-weights', default=GCN_WEIGHTS_PATH,
+                        help="Trained GCN weights saved with MAKGED.save_gcn")
+    parser.add_argument('--screen-epochs', type=int, default=0,
+                        help="Train the structural screen for this many epochs and only "
+                             "send suspicious triples to the agents")
+    parser.add_argument('--scorer', help="Screening scorer to load, or to save once trained with "
+                                         "--screen-epochs; defaults to OUTPUT.scorer")
+    parser.add_argument('--packed', action='store_true',
+                        help="Analyze triples sharing an entity in one request per agent")
+    parser.add_argument('--results-store', nargs='?', const=RESULTS_STORE_PATH,
+                        help="SQLite results store to record results in; triples it already "
+                             "holds for this graph version are skipped")
+    args = parser.parse_args()
+
+    print("Loading graph...")
+    if args.graph:
+        graph_context = load_graph(args.graph, args.graph_format, args.node_features)
+    else:
+        graph_context = load_graph(args.input, args.format, args.node_features)
+
+    print("Initializing MAKGED framework...")
+    options = {'results_store': ResultsStore(args.results_store)} if args.results_store else {}
+    if args.concurrency is not None:
+        options['max_concurrency'] = args.concurrency
+    makged = MAKGED(**options)
+    makged.initialize_gcn(graph_context['num_features'], graph_context['num_embeddings'], args.gcn_weights)
+    screen = args.screen_epochs > 0 or args.scorer is not None
+    if screen:
+        # Saved, so a resumed run screens with the same scorer as the first
+        print("Preparing structural screen...")
+        load_or_train_scorer(makged, graph_context, args.scorer or args.output + '.scorer',
+                             args.screen_epochs)
+    makged.warmup(graph_context)
+
+    validated = validate_stream(
+        makged, args.input, graph_context, args.output,
+        checkpoint_path=args.checkpoint,
+        format=args.format,
+        screen=screen,
+        packed=args.packed,
+        checkpoint_every=args.checkpoint_every
+    )
+    print(f"\nValidated {validated} triples, results in {args.output}")
+    print(f"Cache: {makged.cache_stats()}")
+
+if __name__ == "__main__":
+    main()